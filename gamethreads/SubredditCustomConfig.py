@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 # TODO: This is generic enough that it should be extracted
+import copy
 import yaml
 import os
 import logging
 
+from .wiki import WIKI
+
 WIKI_PATH = "customconfig"
 PROGRAM = "SubedditCustomConfig"
 AUTHOR = "rasherdk"
@@ -27,8 +30,8 @@ class SubredditCustomConfig():
 
     def refresh(self, create_if_missing=True):
         try:
-            page = self.sub.wiki[self.path]
-            self.config = yaml.safe_load(page.content_md)
+            # Shared, parsed again only when the page is revised
+            self.config = copy.deepcopy(WIKI.get_parsed(self.sub, self.path, yaml.safe_load))
         except Exception as e:
             print(e)
             #if create_if_missing:
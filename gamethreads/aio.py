@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from .scheduler import run_lap, next_due
+
+
+class AsyncScheduler:
+    """Drive the laps of many GameThreadThreads as coroutines on one event loop.
+
+    Has the same add()/wake()/start()/terminate() interface as Scheduler.
+    Laps are blocking (database, praw), so each one is awaited in a bounded
+    executor while the loop keeps track of when every updater is due."""
+    staying_alive = True
+
+    def __init__(self, workers=4, logger=None):
+        self.logger = logger or logging.getLogger(type(self).__name__)
+        self.name = type(self).__name__
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lap')
+        self.updaters = []
+        self.wakeups = {}
+        self.loop = None
+
+    def add(self, updater, delay=None):
+        """Start scheduling laps for updater, the first one after delay"""
+        updater.scheduler = self
+        self.wakeups[updater] = asyncio.Event()
+        self.updaters.append((updater, delay.total_seconds() if delay else 0))
+
+    def wake(self, updater):
+        """Run a lap for updater as soon as possible. Safe to call from any thread"""
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.wakeups[updater].set)
+
+    def start(self):
+        """Run the event loop until terminated. Blocks the calling thread"""
+        asyncio.run(self.main())
+
+    async def main(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_signal_handler(signal.SIGINT, self.terminate)
+        self.logger.info("%s starting with %d workers", self.name, self.workers)
+        await asyncio.gather(*[self.run_updater(updater, delay) for updater, delay in self.updaters])
+        self.executor.shutdown(wait=True)
+        self.logger.info("%s ending", self.name)
+
+    async def run_updater(self, updater, delay):
+        due = self.loop.time() + delay
+        await self.rest(updater, due)
+        while self.staying_alive and updater.staying_alive:
+            started = self.loop.time()
+            interval_override = await self.loop.run_in_executor(self.executor, run_lap, updater)
+            woken = self.wakeups[updater].is_set()
+            due = next_due(updater, due, started, interval_override, woken, self.loop.time())
+            self.logger.debug("Next lap of %s in %.1fs", updater.name, due - self.loop.time())
+            await self.rest(updater, due)
+
+    async def rest(self, updater, due):
+        wakeup = self.wakeups[updater]
+        try:
+            await asyncio.wait_for(wakeup.wait(), max(due - self.loop.time(), 0))
+        except asyncio.TimeoutError:
+            pass
+        wakeup.clear()
+
+    def terminate(self):
+        self.logger.warning("%s shutting down", self.name)
+        self.staying_alive = False
+        for updater, _ in self.updaters:
+            updater.staying_alive = False
+            self.wake(updater)
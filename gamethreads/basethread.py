@@ -1,52 +1,124 @@
 from datetime import timedelta
 import logging
 import threading
-import time
 import ctypes
 
 from .models import Game
 from .util import now
+from .metrics import METRICS
 
 class GameThreadThread(threading.Thread):
     staying_alive = True #Ah ah ah ah
-    wait_step = timedelta(seconds=2)
+    # Whether the work is split by game between workers sharing the database.
+    # If not, only the leader runs laps.
+    sharded = False
 
-    def __init__(self, *args, Session = None, logger = None, **kwargs):
+    def __init__(self, *args, Session = None, logger = None, bus = None, shard = None, **kwargs):
         super().__init__(name=self.__class__.__name__)
         self.logger = logger or logging.getLogger(type(self).__name__)
         self.Session = Session
+        self.bus = bus
+        self.shard = shard
         self.game_type = kwargs.get('game_type')
+        # Set when laps are driven by a Scheduler instead of run()
+        self.scheduler = None
+        self.wakeup = threading.Event()
+        self.items = 0
+        self.failures = 0
+        self.changed_lock = threading.Lock()
+        self.changed_games = set()
+        self.next_full_lap = now()
+        self.full_lap = False
 
 
     def run(self):
         self.logger.info("%s starting", self.name)
         self.logger.info("Starting as <%s>", max([ctypes.CDLL('libc.so.6').syscall(cmd) for cmd in (186, 224, 178)]))
         while self.staying_alive:
-            try:
-                start_time = now()
-                interval_override = self.lap()
-                self.logger.debug("Lap took %s", now() - start_time)
-                if interval_override:
-                    sleep_until = now() + interval_override
-                else:
-                    sleep_until = now() + self.interval
-                self.logger.debug("Lap done - time to rest until %s", sleep_until)
-                while self.staying_alive and sleep_until > (now() + self.wait_step):
-                    time.sleep(self.wait_step.seconds)
-                if self.staying_alive:
-                    # Sleep the last bit
-                    time.sleep((sleep_until - now()).seconds)
-            except:
-                self.logger.exception("Exception in thread work")
+            interval_override = self.run_lap()
+            rest = interval_override if interval_override is not None else self.interval
+            self.logger.debug("Lap done - time to rest until %s", now() + rest)
+            self.wakeup.wait(rest.total_seconds())
+            self.wakeup.clear()
         self.logger.info("%s ending", self.name)
 
+    def run_lap(self):
+        """Run a single lap. Returns the lap's interval override, if any"""
+        if self.shard is not None and not self.sharded and not self.shard.leader:
+            self.logger.debug("Not the leader, skipping lap")
+            return None
+        self.items = 0
+        self.failures = 0
+        interval_override = None
+        raised = False
+        start_time = now()
+        try:
+            interval_override = self.lap()
+            self.logger.debug("Lap took %s", now() - start_time)
+        except:
+            self.logger.exception("Exception in thread work")
+            raised = True
+        if interval_override is not None:
+            interval_override = max(interval_override, timedelta(0))
+        METRICS.observe(self.name, (now() - start_time).total_seconds(), self.interval.total_seconds(), self.items, self.failures, raised)
+        return interval_override
+
+    def processed(self, count=1):
+        """Count items (games, threads, teams...) handled in the current lap"""
+        self.items += count
+
+    def failed(self, count=1):
+        """Count items the current lap handled, but failed on and only logged"""
+        self.failures += count
+
     def lap(self):
         self.logger.info("%s says hey there", self.name)
 
+    def wake(self):
+        """Run the next lap now instead of waiting out the interval"""
+        if self.scheduler is not None:
+            self.scheduler.wake(self)
+        else:
+            self.wakeup.set()
+
+    def publish(self, topic, payload):
+        """Publish an event on the bus, if there is one"""
+        if self.bus is not None:
+            self.bus.publish(topic, payload)
+
+    def game_changed(self, game_id):
+        """Bus callback: remember that a game changed and wake up to handle it"""
+        with self.changed_lock:
+            self.changed_games.add(int(game_id))
+        self.wake()
+
+    def take_changed_games(self):
+        """Return the ids of games changed since the last call"""
+        with self.changed_lock:
+            changed, self.changed_games = self.changed_games, set()
+        return changed
+
     def terminate(self):
         self.logger.warning("%s shutting down", self.name)
         self.Session.remove()
         self.staying_alive = False
+        self.wakeup.set()
+
+    def lap_games(self):
+        """Unarchived games to handle in this lap
+
+        All of them when a full lap is due, otherwise only the games changed
+        since the last lap. Laps using this should return until_full_lap()"""
+        changed = self.take_changed_games()
+        self.full_lap = now() >= self.next_full_lap
+        if self.full_lap:
+            self.next_full_lap = now() + self.interval
+            return self.unarchived_games()
+        self.logger.debug("Handling changed games %r", changed)
+        return self.unarchived_games().filter(Game.id.in_(changed))
+
+    def until_full_lap(self):
+        return self.next_full_lap - now()
 
     def active_games(self):
         return self.games().filter(Game.state == Game.ACTIVE)
@@ -59,6 +131,8 @@ class GameThreadThread(threading.Thread):
 
     def games(self):
         games = self.Session().query(Game)
+        if self.shard is not None:
+            games = games.filter(Game.id.in_(self.shard.games))
         if self.game_type is None:
             return games
         return games.filter(Game.game_type == self.game_type)
@@ -0,0 +1,64 @@
+"""Compact deltas between JSON documents, as JSON Patch (RFC 6902)
+
+Unlike a JSON merge patch, a JSON Patch can set a value to null, so
+replaying the deltas gives back exactly the documents they were made from."""
+import copy
+import hashlib
+import json
+
+
+def canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(',', ':'))
+
+
+def content_hash(value):
+    """Hash of a JSON-able value that doesn't depend on key order"""
+    return hashlib.sha1(canonical(value).encode('utf-8')).hexdigest()
+
+
+def _pointer(path, key):
+    return path + '/' + str(key).replace('~', '~0').replace('/', '~1')
+
+
+def _keys(pointer):
+    return [key.replace('~1', '/').replace('~0', '~') for key in pointer.split('/')[1:]]
+
+
+def diff(before, after, path=''):
+    """JSON Patch operations that turn before into after
+
+    Objects are diffed member by member, anything else is replaced whole."""
+    if isinstance(before, dict) and isinstance(after, dict):
+        ops = []
+        for key in before:
+            if key not in after:
+                ops.append({'op': 'remove', 'path': _pointer(path, key)})
+        for key, value in after.items():
+            if key not in before:
+                ops.append({'op': 'add', 'path': _pointer(path, key), 'value': value})
+            else:
+                ops += diff(before[key], value, _pointer(path, key))
+        return ops
+    if canonical(before) == canonical(after):
+        return []
+    return [{'op': 'replace', 'path': path, 'value': after}]
+
+
+def apply(document, ops):
+    """Apply JSON Patch operations made by diff to document, returning the result without changing document
+
+    Only the operations diff makes are supported: add, replace and remove on object members."""
+    document = copy.deepcopy(document)
+    for op in ops:
+        keys = _keys(op['path'])
+        if not keys:
+            document = copy.deepcopy(op.get('value'))
+            continue
+        parent = document
+        for key in keys[:-1]:
+            parent = parent[key]
+        if op['op'] == 'remove':
+            del parent[keys[-1]]
+        else:
+            parent[keys[-1]] = copy.deepcopy(op['value'])
+    return document
@@ -0,0 +1,94 @@
+from collections import defaultdict
+import logging
+import queue
+import select
+import threading
+import time
+
+import sqlalchemy
+
+# A game's data changed. Payload: Game.id
+TOPIC_GAME = 'game'
+# A subreddit's config changed. Payload: Subreddit.name
+TOPIC_CONFIG = 'config'
+# New posts or edits were queued in the outbox. Payload: name of the queueing thread
+TOPIC_OUTBOX = 'outbox'
+
+
+class EventBus:
+    """In-process publish/subscribe channel
+
+    Subscriber callbacks run on the bus' dispatcher thread, so they should
+    only record the event and wake whoever needs to act on it."""
+
+    def __init__(self, logger=None):
+        self.logger = logger or logging.getLogger(type(self).__name__)
+        self.subscribers = defaultdict(list)
+        self.queue = queue.Queue()
+
+    def subscribe(self, topic, callback):
+        self.subscribers[topic].append(callback)
+
+    def publish(self, topic, payload):
+        self.queue.put((topic, str(payload)))
+
+    def start(self):
+        threading.Thread(target=self.dispatch, name=type(self).__name__, daemon=True).start()
+
+    def dispatch(self):
+        while True:
+            topic, payload = self.queue.get()
+            self.deliver(topic, payload)
+
+    def deliver(self, topic, payload):
+        self.logger.debug("Event %s: %s", topic, payload)
+        for callback in self.subscribers[topic]:
+            try:
+                callback(payload)
+            except Exception:
+                self.logger.exception("Subscriber %r failed on %s: %s", callback, topic, payload)
+
+
+class PostgresEventBus(EventBus):
+    """Publish/subscribe across processes through Postgres LISTEN/NOTIFY
+
+    Events published here reach the subscribers of every process listening
+    on the same database, including this one."""
+    channel = 'gamethreads'
+    reconnect_delay = 5
+
+    def __init__(self, engine, logger=None):
+        super().__init__(logger)
+        self.engine = engine
+
+    def publish(self, topic, payload):
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text("SELECT pg_notify(:channel, :message)"),
+                    {'channel': self.channel, 'message': "%s:%s" % (topic, payload)})
+
+    def dispatch(self):
+        while True:
+            try:
+                self.listen()
+            except Exception:
+                self.logger.exception("Lost connection while listening for events, reconnecting")
+                time.sleep(self.reconnect_delay)
+
+    def listen(self):
+        conn = self.engine.raw_connection()
+        try:
+            dbapi_conn = conn.connection
+            dbapi_conn.autocommit = True
+            cursor = dbapi_conn.cursor()
+            cursor.execute("LISTEN %s" % self.channel)
+            self.logger.info("Listening for events on %s", self.channel)
+            while True:
+                if select.select([dbapi_conn], [], [], 60) == ([], [], []):
+                    continue
+                dbapi_conn.poll()
+                while dbapi_conn.notifies:
+                    notify = dbapi_conn.notifies.pop(0)
+                    topic, _, payload = notify.payload.partition(':')
+                    self.deliver(topic, payload)
+        finally:
+            conn.invalidate()
@@ -8,17 +8,22 @@ import os
 import sqlalchemy
 from sqlalchemy.orm import sessionmaker, scoped_session
 
-from .util import setup_logging
+from .util import setup_logging, DatabaseBytecodeCache
 from .threads import *
+from .scheduler import Scheduler
+from .aio import AsyncScheduler
+from . import metrics
+from .events import EventBus, PostgresEventBus
+from .sharding import Shard
 
 def signal_handler(signal, frame):
     print('SIGINT detected, terminating threads!')
     for t in threading.enumerate():
-        if t != threading.main_thread():
+        if t != threading.main_thread() and hasattr(t, 'terminate'):
             t.terminate()
     print('Waiting for threads to terminate')
     for t in threading.enumerate():
-        if t != threading.main_thread():
+        if t != threading.main_thread() and not t.daemon:
             t.join()
     print('Threads terminated, exiting')
 
@@ -31,30 +36,60 @@ class Gamethreader:
         engine = sqlalchemy.create_engine('postgresql+psycopg2://{0[PGUSER]}:{0[POSTGRES_PASSWORD]}@{0[PGHOST]}:{0[PGPORT]}/{0[PGDATABASE]}'.format(os.environ), echo = False)
         session_factory = sessionmaker(bind=engine)
         self.session = scoped_session(session_factory)
+        RENDERER.bytecode_cache = DatabaseBytecodeCache(engine)
+        if os.environ.get('GAMETHREADS_BUS') == 'postgres':
+            self.bus = PostgresEventBus(engine)
+        else:
+            self.bus = EventBus()
+        self.shard = None
+        if os.environ.get('GAMETHREADS_SHARDED'):
+            self.shard = Shard(os.environ.get('GAMETHREADS_WORKER_NAME'))
 
-    def main(self):
+    def main(self, scheduler_class=Scheduler):
         session = self.session
+        bus = self.bus
+        shard = self.shard
 
-        config_updater = ConfigUpdater(sys.argv[1], Session = session)
+        config_updater = ConfigUpdater(sys.argv[1], Session = session, bus = bus, shard = shard)
         # Update configs before doing anything
         config_updater.lap()
+        scheduler = scheduler_class(workers=int(os.environ.get('GAMETHREADS_WORKERS', 4)))
+        scheduler.add(config_updater, delay=config_updater.interval)
+        if shard is not None:
+            # Claim games before anything tries to work on them
+            self.logger.info("Running sharded as %s", shard.worker)
+            lease_updater = LeaseUpdater(Session = session, shard = shard)
+            lease_updater.lap()
+            scheduler.add(lease_updater, delay=lease_updater.interval)
         threads = []
-        threads.append(config_updater)
-        threads.append(GameUpdater(Session = session))
-        threads.append(ThreadPoster(Session = session))
-        threads.append(ThreadUpdater(Session = session))
+        threads.append(GameUpdater(Session = session, bus = bus, shard = shard))
+        threads.append(ThreadPoster(Session = session, bus = bus, shard = shard))
+        threads.append(ThreadUpdater(Session = session, bus = bus, shard = shard))
+        for i in range(int(os.environ.get('GAMETHREADS_OUTBOX_WORKERS', 2))):
+            worker = OutboxWorker(Session = session, bus = bus, shard = shard)
+            worker.name = "%s-%d" % (worker.name, i)
+            threads.append(worker)
 
         for game_type in self.config()['types']:
             self.logger.info("Initiating threads for %s", game_type)
             typethreads = getattr(plugins, game_type).threads
             for t in typethreads.ALL:
-                new = t(Session=session, game_type=game_type)
+                new = t(Session=session, bus=bus, shard=shard, game_type=game_type)
                 if hasattr(new, 'setup') and new.setup:
                     self.logger.info("Running thread %r as setup", new)
-                    new.lap()
-                threads.append(new)
+                    # Through run_lap, so only the leader runs unsharded setup laps
+                    interval_override = new.run_lap()
+                    scheduler.add(new, delay=interval_override or new.interval)
+                else:
+                    threads.append(new)
+        if os.environ.get('GAMETHREADS_METRICS_PORT'):
+            port = int(os.environ['GAMETHREADS_METRICS_PORT'])
+            self.logger.info("Serving metrics on port %d", port)
+            metrics.serve(port)
         self.logger.info("Starting threads")
-        [t.start() for t in threads]
+        bus.start()
+        [scheduler.add(t) for t in threads]
+        scheduler.start()
         self.logger.info("Exiting")
 
     def config(self):
@@ -63,3 +98,7 @@ class Gamethreader:
 def main():
     gt = Gamethreader()
     gt.main()
+
+def main_async():
+    gt = Gamethreader()
+    gt.main(AsyncScheduler)
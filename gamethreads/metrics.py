@@ -0,0 +1,112 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import threading
+import time
+
+# Upper bounds (seconds) of the lap duration histogram buckets
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class UpdaterMetrics:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS)
+        self.duration_sum = 0.0
+        self.laps = 0
+        self.overruns = 0
+        self.exceptions = 0
+        self.item_failures = 0
+        self.items = 0
+        self.items_total = 0
+        self.last_success = None
+
+
+class LapMetrics:
+    """Collects per-updater lap statistics and renders them in the Prometheus text format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.updaters = {}
+
+    def observe(self, updater, duration, interval, items, failures, raised):
+        """Record a finished lap. duration and interval are in seconds
+
+        A lap is successful unless it raised, or every item it handled failed."""
+        with self.lock:
+            m = self.updaters.setdefault(updater, UpdaterMetrics())
+            m.laps += 1
+            m.duration_sum += duration
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    m.buckets[i] += 1
+            if duration > interval:
+                m.overruns += 1
+            m.items = items
+            m.items_total += items
+            m.item_failures += failures
+            if raised:
+                m.exceptions += 1
+            elif not failures or failures < items:
+                m.last_success = time.time()
+
+    def render(self):
+        lines = []
+
+        def metric(name, kind, doc, samples):
+            lines.append("# HELP %s %s" % (name, doc))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for suffix, labels, value in samples:
+                label_str = ",".join('%s="%s"' % (k, v) for k, v in labels)
+                lines.append("%s%s{%s} %s" % (name, suffix, label_str, value))
+
+        with self.lock:
+            updaters = sorted(self.updaters.items())
+            histogram = []
+            for name, m in updaters:
+                for bound, count in zip(BUCKETS, m.buckets):
+                    histogram.append(('_bucket', [('updater', name), ('le', bound)], count))
+                histogram.append(('_bucket', [('updater', name), ('le', '+Inf')], m.laps))
+                histogram.append(('_sum', [('updater', name)], m.duration_sum))
+                histogram.append(('_count', [('updater', name)], m.laps))
+            metric('gamethreads_lap_duration_seconds', 'histogram', 'Time taken by each lap', histogram)
+            metric('gamethreads_lap_overruns_total', 'counter', 'Laps that took longer than the interval',
+                    [('', [('updater', name)], m.overruns) for name, m in updaters])
+            metric('gamethreads_lap_exceptions_total', 'counter', 'Laps that ended in an exception',
+                    [('', [('updater', name)], m.exceptions) for name, m in updaters])
+            metric('gamethreads_lap_item_failures_total', 'counter', 'Items that failed and were skipped by otherwise completed laps',
+                    [('', [('updater', name)], m.item_failures) for name, m in updaters])
+            metric('gamethreads_lap_items', 'gauge', 'Items processed in the most recent lap',
+                    [('', [('updater', name)], m.items) for name, m in updaters])
+            metric('gamethreads_lap_items_total', 'counter', 'Items processed in all laps',
+                    [('', [('updater', name)], m.items_total) for name, m in updaters])
+            now_ = time.time()
+            metric('gamethreads_seconds_since_last_success', 'gauge', 'Time since the last lap that completed without an exception and got at least one item through',
+                    [('', [('updater', name)], now_ - m.last_success) for name, m in updaters if m.last_success is not None])
+        return "\n".join(lines) + "\n"
+
+
+METRICS = LapMetrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve METRICS on /metrics"""
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = METRICS.render().encode("UTF-8")
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve(port):
+    """Serve the metrics endpoint from a daemon thread"""
+    httpd = ThreadingHTTPServer(('', port), MetricsHandler)
+    thread = threading.Thread(target=httpd.serve_forever, name='MetricsServer', daemon=True)
+    thread.start()
+    return httpd
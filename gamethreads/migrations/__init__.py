@@ -0,0 +1,39 @@
+"""Database schema migrations, managed with Alembic
+
+Revisions live in versions/. Use the models command to apply them, e.g.
+``models upgrade`` to bring a database up to date."""
+import os
+
+from alembic import command
+from alembic.config import Config
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def alembic_config(engine):
+    config = Config()
+    config.set_main_option('script_location', HERE)
+    config.attributes['engine'] = engine
+    return config
+
+
+def upgrade(engine, revision='head'):
+    command.upgrade(alembic_config(engine), revision)
+
+
+def downgrade(engine, revision):
+    command.downgrade(alembic_config(engine), revision)
+
+
+def stamp(engine, revision='head'):
+    """Record revision as applied without running anything, e.g. after create_all"""
+    command.stamp(alembic_config(engine), revision)
+
+
+def current(engine):
+    command.current(alembic_config(engine), verbose=True)
+
+
+def revision(engine, message, autogenerate=True):
+    """Write a new revision, by default from the difference between the models and the database"""
+    command.revision(alembic_config(engine), message=message, autogenerate=autogenerate)
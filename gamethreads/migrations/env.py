@@ -0,0 +1,28 @@
+from alembic import context
+
+from gamethreads.models import Base
+# Register the plugins' tables with the metadata
+from gamethreads import plugins
+
+config = context.config
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    url = config.attributes['engine'].url
+    context.configure(url=url, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with config.attributes['engine'].connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
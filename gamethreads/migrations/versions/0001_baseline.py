@@ -0,0 +1,127 @@
+"""Baseline: the schema as created by create_all before migrations existed
+
+Databases created that way are brought under migration with
+``models stamp 0001``.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from gamethreads.models import GAME_STATES
+from gamethreads.plugins.nfl import const
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('game',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('game_id', sa.String, unique=True),
+            sa.Column('game_type', sa.String),
+            sa.Column('state', sa.Enum(*GAME_STATES, name='STATE')),
+            sa.Column('state_changed_utc', sa.DateTime(timezone=True)),
+            )
+    op.create_table('config',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('name', sa.String, unique=True),
+            sa.Column('config_json', sa.String),
+            sa.Column('config_updated_utc', sa.DateTime(timezone=True)),
+            )
+    op.create_table('subreddit',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('name', sa.String, unique=True),
+            sa.Column('config_json', sa.String),
+            sa.Column('config_updated_utc', sa.DateTime(timezone=True)),
+            )
+    op.create_table('thread',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('thread_type', sa.String),
+            sa.Column('thread_id', sa.String, unique=True),
+            sa.Column('sub_id', sa.Integer, sa.ForeignKey('subreddit.id')),
+            sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id')),
+            sa.Column('posted_utc', sa.DateTime(timezone=True)),
+            sa.Column('updated_utc', sa.DateTime(timezone=True)),
+            sa.Column('final', sa.Boolean),
+            sa.Column('url', sa.String),
+            sa.Column('body', sa.Text),
+            )
+    op.create_table('nfl_team',
+            sa.Column('id', sa.String, primary_key=True),
+            sa.Column('abbreviation', sa.String(length=3)),
+            sa.Column('city', sa.String),
+            sa.Column('mascot', sa.String),
+            sa.Column('subreddit', sa.String),
+            sa.Column('twitter', sa.String),
+            sa.Column('fullname', sa.String),
+            sa.Column('record_won', sa.Integer),
+            sa.Column('record_lost', sa.Integer),
+            sa.Column('record_tied', sa.Integer),
+            sa.Column('record_updated_utc', sa.DateTime(timezone=True)),
+            )
+    op.create_table('nfl_game_data',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('datatype', sa.String(255)),
+            sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id')),
+            sa.Column('content_json', sa.String),
+            sa.Column('updated_utc', sa.DateTime(timezone=True)),
+            sa.Column('final', sa.Boolean),
+            )
+    op.create_table('nfl_game_events',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('datetime_utc', sa.DateTime(timezone=True)),
+            sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id')),
+            sa.Column('event', sa.Enum(*sorted(const.EVENTS), name='NFL_EVENT')),
+            )
+    op.create_table('nfl_line',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('book', sa.String),
+            sa.Column('spread', sa.String),
+            sa.Column('total', sa.String),
+            sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id')),
+            )
+    op.create_table('nfl_forecast',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id')),
+            sa.Column('symbol_name', sa.String),
+            sa.Column('symbol_var', sa.String),
+            sa.Column('temp_c', sa.Integer),
+            sa.Column('pressure_hpa', sa.Numeric(precision=5, scale=1, asdecimal=False)),
+            sa.Column('windspeed_mps', sa.Numeric(precision=4, scale=1, asdecimal=False)),
+            sa.Column('prec_mm', sa.Numeric(precision=4, scale=1, asdecimal=False)),
+            )
+    op.create_table('nfl_game',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('shieldid', sa.String, unique=True),
+            sa.Column('game_detail_id', sa.String, unique=True),
+            sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id')),
+            sa.Column('kickoff_utc', sa.DateTime(timezone=True)),
+            sa.Column('home_id', sa.String, sa.ForeignKey('nfl_team.id')),
+            sa.Column('away_id', sa.String, sa.ForeignKey('nfl_team.id')),
+            sa.Column('home_score', sa.Integer),
+            sa.Column('away_score', sa.Integer),
+            sa.Column('seconds_left', sa.Integer, nullable=True),
+            sa.Column('state', sa.Enum(*const.GS, name='NFL_GAME_STATE')),
+            sa.Column('updated_utc', sa.DateTime(timezone=True)),
+            sa.Column('season', sa.Integer),
+            sa.Column('season_type', sa.Enum(*const.SEASON_TYPES, name='NFL_SEASON_TYPE')),
+            sa.Column('week_type', sa.Enum(*const.WEEK_TYPES, name='NFL_WEEK_TYPE')),
+            sa.Column('week', sa.String(length=25)),
+            sa.Column('tv', sa.String),
+            sa.Column('site', sa.String),
+            sa.Column('place', sa.String),
+            )
+
+
+def downgrade():
+    for table in ('nfl_game', 'nfl_forecast', 'nfl_line', 'nfl_game_events', 'nfl_game_data', 'nfl_team',
+            'thread', 'subreddit', 'config', 'game'):
+        op.drop_table(table)
+    for enum in ('NFL_WEEK_TYPE', 'NFL_SEASON_TYPE', 'NFL_GAME_STATE', 'NFL_EVENT', 'STATE'):
+        sa.Enum(name=enum).drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,76 @@
+"""Render fingerprints, leases, the outbox, template bytecode and natural keys of the nfl tables
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+# (table, columns, which duplicate to keep)
+UNIQUE = [
+        ('nfl_game_data', ['game_id'], 'newest'),
+        ('nfl_game_events', ['game_id', 'event'], 'oldest'),
+        ('nfl_line', ['game_id', 'book'], 'newest'),
+        ('nfl_forecast', ['game_id'], 'newest'),
+        ]
+
+
+def constraint_name(table, columns):
+    # What Postgres names the unnamed constraints create_all makes
+    return "%s_%s_key" % (table, "_".join(columns))
+
+
+def upgrade():
+    op.add_column('thread', sa.Column('fingerprint', sa.String))
+    op.create_table('lease',
+            sa.Column('key', sa.String, primary_key=True),
+            sa.Column('worker', sa.String),
+            sa.Column('expires_utc', sa.DateTime(timezone=True)),
+            )
+    op.create_table('outbox',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('kind', sa.Enum('post', 'edit', name='OUTBOX_KIND')),
+            sa.Column('idempotency_key', sa.String, unique=True),
+            sa.Column('sub_id', sa.Integer, sa.ForeignKey('subreddit.id')),
+            sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id')),
+            sa.Column('thread_type', sa.String),
+            sa.Column('thread_pk', sa.Integer, sa.ForeignKey('thread.id')),
+            sa.Column('title', sa.String),
+            sa.Column('body', sa.Text),
+            sa.Column('fingerprint', sa.String),
+            sa.Column('priority', sa.Integer),
+            sa.Column('urgent', sa.Boolean),
+            sa.Column('attempts', sa.Integer),
+            sa.Column('failed', sa.Boolean),
+            sa.Column('last_error', sa.Text),
+            sa.Column('created_utc', sa.DateTime(timezone=True)),
+            sa.Column('not_before_utc', sa.DateTime(timezone=True)),
+            )
+    op.create_table('template_bytecode',
+            sa.Column('key', sa.String, primary_key=True),
+            sa.Column('bytecode', sa.LargeBinary),
+            sa.Column('updated_utc', sa.DateTime(timezone=True)),
+            )
+    for table, columns, keep in UNIQUE:
+        # get_or_create could race and leave duplicates behind
+        same = " AND ".join("a.{0} = b.{0}".format(column) for column in columns)
+        op.execute("DELETE FROM {0} a USING {0} b WHERE {1} AND a.id {2} b.id".format(
+            table, same, '<' if keep == 'newest' else '>'))
+        op.create_unique_constraint(constraint_name(table, columns), table, columns)
+
+
+def downgrade():
+    for table, columns, keep in reversed(UNIQUE):
+        op.drop_constraint(constraint_name(table, columns), table, type_='unique')
+    op.drop_table('template_bytecode')
+    op.drop_table('outbox')
+    sa.Enum(name='OUTBOX_KIND').drop(op.get_bind(), checkfirst=True)
+    op.drop_table('lease')
+    op.drop_column('thread', 'fingerprint')
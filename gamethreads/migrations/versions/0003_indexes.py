@@ -0,0 +1,40 @@
+"""Indexes for the queries every lap makes
+
+The nfl tables' lookups by game_id are covered by the unique constraints
+from 0002, nfl_game.game_detail_id by its unique constraint.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Most laps only look at games that aren't archived
+    op.create_index('ix_game_unarchived', 'game', ['game_type', 'state'], postgresql_where=sa.text("state <> 'archived'"))
+    op.create_index('ix_game_state_changed', 'game', ['state', 'state_changed_utc'])
+    op.create_index('ix_thread_game_sub_type', 'thread', ['game_id', 'sub_id', 'thread_type'])
+    op.create_index('ix_nfl_game_game_id', 'nfl_game', ['game_id'])
+    op.create_index('ix_nfl_game_kickoff', 'nfl_game', ['kickoff_utc'])
+    op.create_index('ix_nfl_game_state', 'nfl_game', ['state'])
+    op.create_index('ix_outbox_due', 'outbox', ['priority', 'not_before_utc'], postgresql_where=sa.text("NOT failed"))
+    op.create_index('ix_outbox_game', 'outbox', ['game_id'])
+
+
+def downgrade():
+    op.drop_index('ix_outbox_game', 'outbox')
+    op.drop_index('ix_outbox_due', 'outbox')
+    op.drop_index('ix_nfl_game_state', 'nfl_game')
+    op.drop_index('ix_nfl_game_kickoff', 'nfl_game')
+    op.drop_index('ix_nfl_game_game_id', 'nfl_game')
+    op.drop_index('ix_thread_game_sub_type', 'thread')
+    op.drop_index('ix_game_state_changed', 'game')
+    op.drop_index('ix_game_unarchived', 'game')
@@ -0,0 +1,23 @@
+"""Store nfl_game_data content as JSONB
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column('nfl_game_data', 'content_json', type_=JSONB, postgresql_using='content_json::jsonb')
+
+
+def downgrade():
+    op.alter_column('nfl_game_data', 'content_json', type_=sa.String, postgresql_using='content_json::text')
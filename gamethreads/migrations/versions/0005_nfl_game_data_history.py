@@ -0,0 +1,33 @@
+"""Content hash of nfl_game_data and the history of its changes
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('nfl_game_data', sa.Column('content_hash', sa.String))
+    op.create_table('nfl_game_data_history',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('game_id', sa.Integer, sa.ForeignKey('game.id')),
+            sa.Column('recorded_utc', sa.DateTime(timezone=True)),
+            sa.Column('content_hash', sa.String),
+            sa.Column('patch', JSONB),
+            )
+    op.create_index('ix_nfl_game_data_history_game', 'nfl_game_data_history', ['game_id', 'recorded_utc'])
+
+
+def downgrade():
+    op.drop_index('ix_nfl_game_data_history_game', 'nfl_game_data_history')
+    op.drop_table('nfl_game_data_history')
+    op.drop_column('nfl_game_data', 'content_hash')
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 import json
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Boolean, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Boolean, Text, LargeBinary, Index, text
 from sqlalchemy.orm import relationship, backref
 
 GAME_PENDING = 'pending'
@@ -9,11 +9,20 @@ GAME_CLOSED = 'closed'
 GAME_ARCHIVED = 'archived'
 GAME_STATES = [GAME_PENDING, GAME_ACTIVE, GAME_CLOSED, GAME_ARCHIVED]
 
+OUTBOX_POST = 'post'
+OUTBOX_EDIT = 'edit'
+OUTBOX_KINDS = [OUTBOX_POST, OUTBOX_EDIT]
+
 from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 
 class Game(Base):
     __tablename__ = 'game'
+    __table_args__ = (
+            # Most laps only look at games that aren't archived
+            Index('ix_game_unarchived', 'game_type', 'state', postgresql_where=text("state <> 'archived'")),
+            Index('ix_game_state_changed', 'state', 'state_changed_utc'),
+            )
     PENDING = GAME_PENDING
     ACTIVE = GAME_ACTIVE
     CLOSED = GAME_CLOSED
@@ -69,6 +78,9 @@ class Subreddit(Base):
 
 class Thread(Base):
     __tablename__ = 'thread'
+    __table_args__ = (
+            Index('ix_thread_game_sub_type', 'game_id', 'sub_id', 'thread_type'),
+            )
 
     id = Column(Integer, primary_key=True)
     thread_type = Column(String)
@@ -82,26 +94,117 @@ class Thread(Base):
     final = Column(Boolean, default=False)
     url = Column(String)
     body = Column(Text)
+    # Hash of the render inputs body was made from, see Renderer.fingerprint
+    fingerprint = Column(String)
 
     def __repr__(self):
         return "<Thread(id={0.id}, thread_id={0.thread_id})>".format(self)
 
 
+class Outbox(Base):
+    """A post or edit waiting to be sent to reddit
+
+    Rows are written when a thread is rendered and deleted once reddit has
+    accepted the post or edit. idempotency_key makes sure there is only one
+    pending post per (sub, game, thread type) and one pending edit per thread."""
+    __tablename__ = 'outbox'
+    __table_args__ = (
+            Index('ix_outbox_due', 'priority', 'not_before_utc', postgresql_where=text("NOT failed")),
+            Index('ix_outbox_game', 'game_id'),
+            )
+    POST = OUTBOX_POST
+    EDIT = OUTBOX_EDIT
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(Enum(*OUTBOX_KINDS, name='OUTBOX_KIND'))
+    idempotency_key = Column(String, unique=True)
+    sub_id = Column(Integer, ForeignKey('subreddit.id'))
+    sub = relationship("Subreddit")
+    game_id = Column(Integer, ForeignKey('game.id'))
+    game = relationship("Game")
+    thread_type = Column(String)
+    # The thread to edit. Not set for posts
+    thread_pk = Column(Integer, ForeignKey('thread.id'))
+    thread = relationship("Thread")
+    title = Column(String)
+    body = Column(Text)
+    fingerprint = Column(String)
+    # Lower is sent first. Urgent rows are sent even when the rate limit budget is short
+    priority = Column(Integer, default=0)
+    urgent = Column(Boolean, default=False)
+    attempts = Column(Integer, default=0)
+    failed = Column(Boolean, default=False)
+    last_error = Column(Text)
+    created_utc = Column(DateTime(timezone=True))
+    not_before_utc = Column(DateTime(timezone=True))
+
+    @staticmethod
+    def post_key(sub_id, game_id, thread_type):
+        return "post:%d:%d:%s" % (sub_id, game_id, thread_type)
+
+    @staticmethod
+    def edit_key(thread_pk):
+        return "edit:%d" % thread_pk
+
+    def __repr__(self):
+        return "<Outbox(id={0.id}, key={0.idempotency_key}, attempts={0.attempts})>".format(self)
+
+
+class Lease(Base):
+    """A worker's time-limited claim on a key, when several workers share the database
+
+    Keys are 'worker:<name>' (heartbeat), 'leader' or 'game:<Game.id>'."""
+    __tablename__ = 'lease'
+
+    key = Column(String, primary_key=True)
+    worker = Column(String)
+    expires_utc = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return "<Lease(key={0.key}, worker={0.worker}, expires_utc={0.expires_utc})>".format(self)
+
+
+class TemplateBytecode(Base):
+    """Compiled wiki templates, see DatabaseBytecodeCache"""
+    __tablename__ = 'template_bytecode'
+
+    key = Column(String, primary_key=True)
+    bytecode = Column(LargeBinary)
+    updated_utc = Column(DateTime(timezone=True))
+
+    def __repr__(self):
+        return "<TemplateBytecode(key={0.key}, updated_utc={0.updated_utc})>".format(self)
+
+
+USAGE = """Usage: %s <command>
+
+create_all            Create all tables in an empty database and mark it as up to date
+drop_all              Drop all tables
+upgrade [revision]    Apply migrations up to revision (default: the latest)
+downgrade <revision>  Revert migrations down to revision
+stamp [revision]      Mark the database as being at revision without changing it
+current               Show the revision of the database
+revision <message>    Write a migration for the difference between the models and the database"""
+
 def main():
     import sys
-    if len(sys.argv) <= 1 or sys.argv[1] not in ('create_all', 'drop_all'):
-        print("Usage: %s create_all|drop_all" % sys.argv[0])
+    commands = ('create_all', 'drop_all', 'upgrade', 'downgrade', 'stamp', 'current', 'revision')
+    if len(sys.argv) <= 1 or sys.argv[1] not in commands or (sys.argv[1] in ('downgrade', 'revision') and len(sys.argv) <= 2):
+        print(USAGE % sys.argv[0])
         sys.exit(1)
 
     import sqlalchemy
     from sqlalchemy.orm import sessionmaker
     import os
+    from . import migrations
     engine = sqlalchemy.create_engine('postgresql+psycopg2://{0[PGUSER]}:{0[POSTGRES_PASSWORD]}@{0[PGHOST]}:{0[PGPORT]}/{0[PGDATABASE]}'.format(os.environ), echo=True)
     session = sessionmaker(bind=engine)
     cmd = sys.argv[1]
+    args = sys.argv[2:]
     if cmd == 'create_all':
         from . import plugins
         Base.metadata.create_all(engine)
+        migrations.stamp(engine)
     elif cmd == 'drop_all':
         # Thank you univerio https://stackoverflow.com/a/38679457
         from sqlalchemy.schema import DropTable
@@ -113,6 +216,18 @@ def main():
             return compiler.visit_drop_table(element) + " CASCADE"
 
         Base.metadata.drop_all(engine)
+        with engine.begin() as conn:
+            conn.execute(sqlalchemy.text("DROP TABLE IF EXISTS alembic_version"))
+    elif cmd == 'upgrade':
+        migrations.upgrade(engine, *args)
+    elif cmd == 'downgrade':
+        migrations.downgrade(engine, args[0])
+    elif cmd == 'stamp':
+        migrations.stamp(engine, *args)
+    elif cmd == 'current':
+        migrations.current(engine)
+    elif cmd == 'revision':
+        migrations.revision(engine, " ".join(args))
 
 
 if __name__ == "__main__":
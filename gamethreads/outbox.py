@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import Game, Outbox
+from .util import now
+from . import plugins
+
+GAME_STATE_RANK = {
+        Game.ACTIVE: 0,
+        Game.PENDING: 1,
+        Game.CLOSED: 2,
+        Game.ARCHIVED: 3,
+        }
+# Posts go out before any edit
+POST_PRIORITY = -1000
+
+
+def edit_priority(game, thread_config):
+    """Sort key for a pending edit. Lower is sent first
+
+    Games are ordered by state, live ones by the plugin's urgency (e.g. the
+    4th quarter before the 1st), then by the thread config's priority. Ties
+    go to the thread that has gone longest without an edit."""
+    plugin = getattr(plugins, game.game_type)
+    urgency = plugin.urgency(game) if hasattr(plugin, 'urgency') else 0
+    return GAME_STATE_RANK.get(game.state, 1) * 100 - urgency * 10 - thread_config.get('priority', 0)
+
+
+def thread_config(sub, thread_type):
+    """The config of a subreddit's thread type, empty if it's no longer configured"""
+    return next((thread for thread in sub.config['threads'] if thread['id'] == thread_type), {})
+
+
+def edit_spacing(thread_config):
+    return timedelta(seconds=thread_config.get('edit_spacing', 0))
+
+
+def queue_post(session, sub, game, thread_config, title, body, fingerprint):
+    """Add a post to the outbox, unless one is already pending for the same thread"""
+    stmt = insert(Outbox).values(
+            kind=Outbox.POST,
+            idempotency_key=Outbox.post_key(sub.id, game.id, thread_config['id']),
+            sub_id=sub.id,
+            game_id=game.id,
+            thread_type=thread_config['id'],
+            title=title,
+            body=body,
+            fingerprint=fingerprint,
+            priority=POST_PRIORITY,
+            urgent=True,
+            attempts=0,
+            failed=False,
+            created_utc=now(),
+            not_before_utc=now(),
+            )
+    session.execute(stmt.on_conflict_do_nothing(index_elements=[Outbox.idempotency_key]))
+
+
+def queue_edit(session, thread, thread_config, body):
+    """Add an edit to the outbox, replacing the body of any edit already pending for the thread
+
+    The edit won't be sent until edit_spacing seconds after the thread's last edit."""
+    game = thread.game
+    not_before = now()
+    if thread.updated_utc is not None:
+        not_before = max(not_before, thread.updated_utc + edit_spacing(thread_config))
+    stmt = insert(Outbox).values(
+            kind=Outbox.EDIT,
+            idempotency_key=Outbox.edit_key(thread.id),
+            sub_id=thread.sub_id,
+            game_id=thread.game_id,
+            thread_type=thread.thread_type,
+            thread_pk=thread.id,
+            body=body,
+            priority=edit_priority(game, thread_config),
+            urgent=game.state == Game.ACTIVE,
+            attempts=0,
+            failed=False,
+            created_utc=now(),
+            not_before_utc=not_before,
+            )
+    # Collapse with the pending edit, keeping its place in line
+    stmt = stmt.on_conflict_do_update(index_elements=[Outbox.idempotency_key], set_={
+        'body': stmt.excluded.body,
+        'priority': stmt.excluded.priority,
+        'urgent': stmt.excluded.urgent,
+        'failed': False,
+        })
+    session.execute(stmt)
+
+
+def discard_edit(session, thread):
+    """Drop the pending edit of a thread, e.g. because it rendered back to what's posted"""
+    session.query(Outbox).filter(Outbox.idempotency_key == Outbox.edit_key(thread.id)).delete(synchronize_session=False)
+
+
+def backoff(attempts):
+    return min(timedelta(minutes=1) * 2 ** attempts, timedelta(hours=1))
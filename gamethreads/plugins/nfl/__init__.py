@@ -5,23 +5,75 @@ from . import gamefinder
 from . import nflteams
 from gamethreads.util import NotReadyException
 
+CONST = {s: getattr(const, s) for s in dir(const) if not s.startswith('_')}
+
+def localize(game, config):
+    """Make the game's times render in the subreddit's timezone"""
+    tz = pytz.timezone(config['timezone'])
+    if game.nfl_game is not None:
+        game.nfl_game.local_tz = tz
+    for event in game.nfl_events:
+        event.local_tz = tz
+    return tz
+
+def context_version(game):
+    """Something that changes whenever the data make_context reads for game changes"""
+    nfl_game = game.nfl_game
+    return (
+            nfl_game.updated_utc if nfl_game else None,
+            game.nfl_data.updated_utc if game.nfl_data else None,
+            len(game.nfl_events),
+            len(game.nfl_lines),
+            )
+
+def _row(obj):
+    if obj is None:
+        return ()
+    return tuple(getattr(obj, column.key) for column in obj.__table__.columns)
+
+def input_versions(game):
+    """Version of the data behind each key of make_context, for fingerprinting renders"""
+    nfl_game = game.nfl_game
+    data = game.nfl_data.updated_utc if game.nfl_data else ()
+    events = tuple((event.event, event.datetime_utc) for event in game.nfl_events)
+    records = ()
+    if nfl_game is not None:
+        records = tuple(team.record if team else () for team in (nfl_game.home, nfl_game.away))
+    return {
+            'game': (_row(nfl_game), records),
+            'kickoff': nfl_game.kickoff_utc if nfl_game else (),
+            'events': events,
+            'events_list': events,
+            'boxscore': (),
+            'data': data,
+            'const': (),
+            'lines': tuple((line.book, line.spread, line.total) for line in game.nfl_lines),
+            'forecast': _row(game.nfl_forecast),
+            'scoring': data,
+            }
+
+def urgency(game):
+    """How urgently the game's threads need edits, relative to other live games"""
+    state = game.nfl_game.state if game.nfl_game else None
+    if state in (const.GS_Q4, const.GS_OT):
+        return 3
+    if state in const.GS_PLAYING and state != const.GS_HT:
+        return 2
+    if state == const.GS_HT:
+        return 1
+    return 0
+
 def make_context(game, config):
     """Create the context to be passed into the template render - also for the post expression"""
-    tz = pytz.timezone(config['timezone'])
     nfl_game = game.nfl_game
     if nfl_game is None:
         raise NotReadyException("Game %s does not have an nfl_game" % game)
-    nfl_game.local_tz = tz
-    for event in game.nfl_events:
-        event.local_tz = tz
-    # Fix teams in scoring summary
+    tz = localize(game, config)
+    # Fix teams in scoring summary, on copies so the stored content stays as it is
     scoring = []
-    if game.nfl_data and game.nfl_data.content and 'scrsummary' in game.nfl_data.content:
-        scoring = {int(drive_id): drive for drive_id, drive in game.nfl_data.content['scrsummary'].items()}
-        for drive_id in scoring:
-            team_id = scoring[drive_id]['team']
-            team = nflteams.get_team(team_id)
-            scoring[drive_id]['team'] = team
+    content = game.nfl_data.content if game.nfl_data else None
+    if content and 'scrsummary' in content:
+        scoring = {int(drive_id): dict(drive, team=nflteams.get_team(drive['team'])) for drive_id, drive in content['scrsummary'].items()}
 
     return {
             'game': nfl_game,
@@ -30,7 +82,7 @@ def make_context(game, config):
             'events_list': game.nfl_events,
             'boxscore': None,
             'data': game.nfl_data,
-            'const': {s: getattr(const, s) for s in dir(const) if not s.startswith('_')},
+            'const': CONST,
             'lines': {line.book: line for line in game.nfl_lines},
             'forecast': game.nfl_forecast,
             'scoring': scoring,
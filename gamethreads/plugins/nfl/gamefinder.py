@@ -1,5 +1,9 @@
+from sqlalchemy import case, func, select
+
 from gamethreads.util import now
+from gamethreads.models import Game
 from .const import *
+from .models import NFLGame
 from sgqlc.operation import Operation
 
 from nflapi import NFL, shield
@@ -27,3 +31,14 @@ def update_state(game):
         elif game.nfl_game.state in GS_FINAL:
             game.state = game.CLOSED
     return game
+
+def state_expression():
+    """SQL version of update_state, for updating the states of all games at once"""
+    nfl_state = select(NFLGame.state).where(NFLGame.game_id == Game.id).scalar_subquery()
+    return case(
+            (nfl_state == GS_PENDING, Game.PENDING),
+            (nfl_state.in_(GS_PLAYING), Game.ACTIVE),
+            (nfl_state.in_(GS_FINAL), Game.CLOSED),
+            # No nfl_game yet, or a state that doesn't move the game
+            else_=func.coalesce(Game.state, Game.PENDING),
+            )
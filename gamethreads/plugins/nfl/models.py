@@ -1,14 +1,15 @@
-import json
 import re
 from datetime import timedelta
 
 import pytz
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Boolean, Numeric
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Enum, Boolean, Numeric, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.orm.session import Session
 
 from ...models import Base
 from ...util import now
+from ... import delta
 from . import const
 
 
@@ -101,16 +102,22 @@ def sort_yards(x):
 
 class NFLGameData(Base):
     __tablename__ = 'nfl_game_data'
+    __table_args__ = (UniqueConstraint('game_id'),)
 
     id = Column(Integer, primary_key=True)
     datatype = Column(String(255))
     game_id = Column(Integer, ForeignKey('game.id'))
     game = relationship("Game", backref=backref('nfl_data', order_by=datatype, uselist=False), foreign_keys='NFLGameData.game_id', lazy='joined')
-    content_json = Column(String)
+    # Decoded once when the row is loaded
+    content_json = Column(JSONB)
+    # delta.content_hash() of content
+    content_hash = Column(String)
     updated_utc = Column(DateTime(timezone=True))
     final = Column(Boolean, default=False)
     
     local_tz = None
+    # (content it was made from, performers)
+    _performers = None
     
     @property
     def updated(self):
@@ -128,19 +135,43 @@ class NFLGameData(Base):
 
     @property
     def content(self):
-        return json.loads(self.content_json) if self.content_json else None
+        return self.content_json
 
     @content.setter
     def content(self, value):
-        self.content_json = json.dumps(value)
+        self.content_json = value
+        self._performers = None
         self.updated_utc = now()
 
+    def update_content(self, value):
+        """Store new content, unless it's the same as what's stored
+
+        Returns the NFLGameDataHistory entry recording the change, or None
+        if nothing changed."""
+        digest = delta.content_hash(value)
+        if digest == self.content_hash:
+            return None
+        # The first entry holds the whole document, so the history replays from nothing
+        previous = self.content if self.content_hash is not None else None
+        entry = NFLGameDataHistory(game_id=self.game_id, recorded_utc=now(), content_hash=digest,
+                patch=delta.diff(previous or {}, value))
+        self.content = value
+        self.content_hash = digest
+        return entry
+
     @property
     def performers(self):
-        ret = {'home': {}, 'away': {}}
         js = self.content
         if js is None:
             return None
+        # Also catches content reloaded from the database
+        if self._performers is None or self._performers[0] is not js:
+            self._performers = (js, self._make_performers(js))
+        return self._performers[1]
+
+    @staticmethod
+    def _make_performers(js):
+        ret = {'home': {}, 'away': {}}
 
         for who in 'home', 'away':
             for stat in ('passing', 'rushing', 'receiving'):
@@ -159,9 +190,33 @@ class NFLGameData(Base):
         return "<NFLGameData(id={0.id}, game={0.game}, datatype={0.datatype})>".format(self)
 
 
+class NFLGameDataHistory(Base):
+    """Every change to a game's NFLGameData content, as a JSON Patch on the previous content"""
+    __tablename__ = 'nfl_game_data_history'
+    __table_args__ = (Index('ix_nfl_game_data_history_game', 'game_id', 'recorded_utc'),)
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, ForeignKey('game.id'))
+    recorded_utc = Column(DateTime(timezone=True))
+    content_hash = Column(String)
+    patch = Column(JSONB)
+
+    @classmethod
+    def timeline(cls, session, game_id):
+        """Replay the changes to a game's content. Yields (recorded_utc, content)"""
+        content = {}
+        for entry in session.query(cls).filter(cls.game_id == game_id).order_by(cls.recorded_utc, cls.id):
+            content = delta.apply(content, entry.patch)
+            yield entry.recorded_utc, content
+
+    def __repr__(self):
+        return "<NFLGameDataHistory(id={0.id}, game_id={0.game_id}, recorded_utc={0.recorded_utc})>".format(self)
+
+
 class NFLGameEvent(Base):
 
     __tablename__ = 'nfl_game_events'
+    __table_args__ = (UniqueConstraint('game_id', 'event'),)
     id = Column(Integer, primary_key=True)
     datetime_utc = Column(DateTime(timezone=True))
     game_id = Column(Integer, ForeignKey('game.id'))
@@ -183,6 +238,7 @@ class NFLGameEvent(Base):
 class NFLLine(Base):
     """Spread and total is relative to the home team"""
     __tablename__ = 'nfl_line'
+    __table_args__ = (UniqueConstraint('game_id', 'book'),)
 
     id = Column(Integer, primary_key=True)
     book = Column(String)
@@ -198,6 +254,7 @@ class NFLLine(Base):
 class NFLForecast(Base):
     """Weather forecast, fetched from yr.no"""
     __tablename__ = 'nfl_forecast'
+    __table_args__ = (UniqueConstraint('game_id'),)
 
     id = Column(Integer, primary_key=True)
     game_id = Column(Integer, ForeignKey('game.id'))
@@ -227,6 +284,11 @@ class NFLForecast(Base):
 
 class NFLGame(Base):
     __tablename__ = 'nfl_game'
+    __table_args__ = (
+            Index('ix_nfl_game_game_id', 'game_id'),
+            Index('ix_nfl_game_kickoff', 'kickoff_utc'),
+            Index('ix_nfl_game_state', 'state'),
+            )
 
     id = Column(Integer, primary_key=True) 
     shieldid = Column(String, unique=True)
@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from ...util import now
+from .const import *
+
+POLL_PENDING = 'pending'
+POLL_PENDING_NEAR = 'pending near kickoff'
+POLL_PLAYING = 'playing'
+POLL_HALFTIME = 'halftime'
+POLL_FINAL_GRACE = 'final grace'
+POLL_DONE = 'done'
+
+
+def poll_phase(game, near, grace):
+    """Decide how urgently a game needs polling, judging only by its own state"""
+    nflgame = game.nfl_game
+    if nflgame is None or nflgame.state in (None, GS_UNKNOWN, GS_PENDING):
+        if nflgame is None or nflgame.kickoff_utc is None or nflgame.kickoff_utc - now() < near:
+            return POLL_PENDING_NEAR
+        return POLL_PENDING
+    if nflgame.state == GS_HT:
+        return POLL_HALFTIME
+    if nflgame.state in GS_FINAL:
+        finals = [event.datetime_utc for event in game.nfl_events if event.event in (EV_FINAL, EV_FINAL_OT)]
+        ended = max(finals) if finals else nflgame.updated_utc
+        if ended is None or now() - ended < grace:
+            return POLL_FINAL_GRACE
+        return POLL_DONE
+    return POLL_PLAYING
+
+
+class PollSchedule:
+    """Remember when each game is next due to be polled
+
+    cadence maps every POLL_* phase to the time between polls of a game in
+    that phase, or None if such games should not be polled at all. Games
+    that haven't been polled yet are due right away. Games in a phase that
+    isn't polled become due as soon as they move on to one that is."""
+
+    def __init__(self, cadence, near=timedelta(minutes=15), grace=timedelta(minutes=30)):
+        self.cadence = cadence
+        self.near = near
+        self.grace = grace
+        self.next_poll = {}
+
+    def due(self, games):
+        """Filter games down to the ones due for a poll, forgetting about games no longer passed in"""
+        games = list(games)
+        self.next_poll = {game.id: self.next_poll[game.id] for game in games if game.id in self.next_poll}
+        now_ = now()
+        return [game for game in games if self.is_due(game, now_)]
+
+    def is_due(self, game, now_):
+        if game.id not in self.next_poll:
+            return True
+        next_poll = self.next_poll[game.id]
+        if next_poll is None:
+            # Its state may have changed since
+            return self.cadence.get(poll_phase(game, self.near, self.grace)) is not None
+        return next_poll <= now_
+
+    def polled(self, game):
+        """Record that game was just polled and work out when it is due again"""
+        phase = poll_phase(game, self.near, self.grace)
+        interval = self.cadence.get(phase)
+        if interval is None:
+            self.next_poll[game.id] = None
+            return
+        next_poll = now() + interval
+        if phase == POLL_PENDING:
+            # Wake up in time to poll at the near-kickoff rate
+            next_poll = min(next_poll, game.nfl_game.kickoff_utc - self.near)
+        self.next_poll[game.id] = next_poll
+
+    def next_interval(self):
+        """Time until the next game is due, or None if no game needs polling"""
+        upcoming = [next_poll for next_poll in self.next_poll.values() if next_poll is not None]
+        if not upcoming:
+            return None
+        return max(min(upcoming) - now(), timedelta(0))
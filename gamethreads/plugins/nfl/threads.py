@@ -3,20 +3,20 @@ from pprint import pprint
 from urllib.request import urlopen
 import urllib
 import pendulum
-from sqlalchemy import func
-from sqlalchemy.sql import exists
 from sqlalchemy.orm import aliased
 from sgqlc.operation import Operation
 
 #from . import nflteams, nflcom, espn, nfllive, schedule, sites
 from . import espn, sites, nflteams
+from .polling import *
 
 from nflapi import NFL, shield
 from nflapi.shield import OrderByDirection, WeekOrderBy
 
-from ...util import get_or_create, now
+from ...util import upsert, now, fetch_all
 from ...basethread import GameThreadThread
 from ...models import Game
+from ...events import TOPIC_GAME
 
 from .const import *
 from .models import *
@@ -28,50 +28,64 @@ UTC = pytz.utc
 GAMETYPE = 'nfl'
 
 
-def decide_sleep(session, NFLGame, active_interval, interval):
-    # If we have active games, update sooner
-    any_playing = session.query(exists().where(NFLGame.state.in_(GS_PLAYING))).scalar()
-    if any_playing:
-        return active_interval
-    # If a game is starting soon (or should have started), update sooner
-    upcoming = session.query(func.min(NFLGame.kickoff_utc).label("min_kickoff")).filter(NFLGame.state == GS_PENDING)
-    first_start = upcoming.one().min_kickoff
-    if first_start is None:
-        return interval
-    if first_start < (now() + interval):
-        return max(first_start - now(), active_interval)
-
-
 class NFLBoxscoreUpdater(GameThreadThread):
     interval = timedelta(minutes=15)
-    active_interval = timedelta(minutes=2)
+    sharded = True
     nfl = NFL('gamethread/boxscore')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.schedule = PollSchedule({
+            POLL_PENDING: None,
+            POLL_PENDING_NEAR: None,
+            POLL_PLAYING: timedelta(minutes=2),
+            POLL_HALFTIME: timedelta(minutes=5),
+            POLL_FINAL_GRACE: timedelta(minutes=2),
+            POLL_DONE: None,
+            })
     
     def lap(self):
         session = self.Session()
         # Should probably get all at once
         # Make sure all games get a final update, even after they are completed
-        for game in self.unarchived_games().join(Game.nfl_game).filter(NFLGame.state != GS_PENDING).filter(NFLGame.game_detail_id != None):
+        todo = []
+        games = self.unarchived_games().join(Game.nfl_game).filter(NFLGame.state != GS_PENDING).filter(NFLGame.game_detail_id != None)
+        due = list(self.schedule.due(games))
+        gamedatas = upsert(session, NFLGameData, [{'game_id': game.id} for game in due], ['game_id'], update=())
+        for game, gamedata in zip(due, gamedatas):
             self.logger.debug("Updating boxscore for %r", game)
-            gamedata, created = get_or_create(session, NFLGameData, game=game)
             if gamedata.final:
                 self.logger.debug("Game %r is final, skipping", game)
+                self.schedule.polled(game)
                 continue
-            json = self.get_json(game.nfl_game.game_detail_id)
+            todo.append((game, gamedata))
+        jsons = fetch_all(self.get_json, [game.nfl_game.game_detail_id for game, gamedata in todo])
+        self.processed(len(todo))
+        changed = []
+        for (game, gamedata), json in zip(todo, jsons):
             if not json:
                 self.logger.debug("No data found for %r, skipping", game)
                 continue
             if 'drives' in json:
                 del(json['drives'])
-            gamedata.content = json
+            entry = gamedata.update_content(json)
+            if entry is not None:
+                session.add(entry)
+                changed.append(game.id)
+            else:
+                self.logger.debug("Boxscore for %r unchanged", game)
             if game.nfl_game.state in GS_FINAL:
                 self.logger.info("Game %r is final. No more boxscore updates", game)
                 gamedata.final = True
+        for game, gamedata in todo:
+            self.schedule.polled(game)
         session.commit()
-
-        new_int = decide_sleep(session, NFLGame, self.active_interval, self.interval)
+        for game_id in changed:
+            self.publish(TOPIC_GAME, game_id)
         session.close()
-        if new_int:
+
+        new_int = self.schedule.next_interval()
+        if new_int is not None and new_int < self.interval:
             self.logger.debug("Shortened sleep: %s", new_int)
             return new_int
 
@@ -124,6 +138,7 @@ class NFLTeamDataUpdater(GameThreadThread):
                 if record and record != (team.record_won, team.record_lost, team.record_tied):
                     self.logger.info("Updating record for %r to %r", team, record)
                     team.record = record
+                    self.processed()
             except Exception as e:
                 self.logger.exception("Error updating record for %r", team)
         session.commit()
@@ -138,12 +153,23 @@ class NFLTeamDataUpdater(GameThreadThread):
 
 class NFLGameStateUpdater(GameThreadThread):
     interval = timedelta(minutes=15)
-    active_interval = timedelta(seconds=30)
+    sharded = True
     setup = True
     nfl = NFL('gamethread/gamestate')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.schedule = PollSchedule({
+            POLL_PENDING: self.interval,
+            POLL_PENDING_NEAR: timedelta(seconds=30),
+            POLL_PLAYING: timedelta(seconds=30),
+            POLL_HALFTIME: timedelta(minutes=1),
+            POLL_FINAL_GRACE: timedelta(minutes=2),
+            POLL_DONE: None,
+            })
+
     def get_game_detail_ids(self, ids):
-        return [(game_id, self.nfl.game.game_detail_id_for_id(game_id)) for game_id in ids]
+        return list(zip(ids, fetch_all(self.nfl.game.game_detail_id_for_id, ids)))
 
     def lap(self):
         session = self.Session()
@@ -154,14 +180,18 @@ class NFLGameStateUpdater(GameThreadThread):
             lut[game_id].game_detail_id = gdi
 
         games = self.unarchived_games().join(Game.nfl_game, full=True).filter(NFLGame.game_detail_id != None)
-        lut = {game.nfl_game.game_detail_id: game for game in games}
-        ids = lut.keys()
+        lut = {game.nfl_game.game_detail_id: game for game in self.schedule.due(games)}
+        ids = list(lut.keys())
+        changed = []
         for gd in self.get_game_details(ids):
             if not hasattr(gd, 'id'):
                 # Sometimes we know the id of objects that don't exist (??)
                 continue
             game = lut[gd.id]
             nflgame = game.nfl_game
+            self.processed()
+            before = (nflgame.home_score, nflgame.away_score, nflgame.state)
+            seconds_left = nflgame.seconds_left
             nflgame.home_score = gd.home_points_total
             nflgame.away_score = gd.visitor_points_total
             old = nflgame.state
@@ -170,16 +200,25 @@ class NFLGameStateUpdater(GameThreadThread):
             if old != new:
                 self.logger.info("New state for %r -> %s", nflgame, new)
                 self.generate_events(game, old, new, session)
+            if before != (nflgame.home_score, nflgame.away_score, nflgame.state):
+                changed.append(game.id)
             if new in GS_FINAL:
                 nflgame.seconds_left = None
             else:
                 nflgame.clock = gd.game_clock
-            nflgame.updated_utc = now()
+            # Renders are fingerprinted by the row, so polls that found
+            # nothing new must leave it alone
+            if before + (seconds_left,) != (nflgame.home_score, nflgame.away_score, nflgame.state, nflgame.seconds_left):
+                nflgame.updated_utc = now()
+        for game in lut.values():
+            self.schedule.polled(game)
         
         session.commit()
-        new_int = decide_sleep(session, NFLGame, self.active_interval, self.interval) 
+        for game_id in changed:
+            self.publish(TOPIC_GAME, game_id)
         session.close()
-        if new_int:
+        new_int = self.schedule.next_interval()
+        if new_int is not None and new_int < self.interval:
             self.logger.debug("Shortened sleep: %s", new_int)
             return new_int
 
@@ -226,13 +265,16 @@ class NFLGameStateUpdater(GameThreadThread):
     def generate_events(self, game, from_gs, to_gs, session):
         self.logger.debug("State change %s -> %s for %s", from_gs, to_gs, game)
         now_ = now()
+        rows = []
         for event in self.find_events(from_gs, to_gs):
             self.logger.info("Event %s for game %s", event, game)
             if event == EV_KICKOFF_SCHEDULED:
                 dt = game.nfl_game.kickoff_utc
             else:
                 dt = now_
-            event, created = get_or_create(session, NFLGameEvent, game=game, event=event, datetime_utc=dt)
+            rows.append({'game_id': game.id, 'event': event, 'datetime_utc': dt})
+        # An event that already happened keeps its original time
+        upsert(session, NFLGameEvent, rows, ['game_id', 'event'], update=())
 
     def find_events(self, from_gs, to_gs):
         """Figure out which events must have happened to take us from one state to another"""
@@ -265,20 +307,21 @@ class NFLTeamUpdater(GameThreadThread):
 
     def lap(self):
         session = self.Session()
+        rows = []
         for team in self.get_teams():
-            t, created = get_or_create(session, NFLTeam, id=team.id)
-            t.abbreviation = team.abbreviation
-            t.city = team.location
-            t.mascot = team.nick_name
-            t.fullname = team.full_name
-            teaminfo = nflteams.get_team(t.abbreviation)
-            if teaminfo:
-                t.subreddit = teaminfo['subreddit'].replace('/r/', '')
-            t.twitter = ''
-            if created:
-                self.logger.info("Adding team %r", t)
-                session.add(t)
-
+            teaminfo = nflteams.get_team(team.abbreviation)
+            rows.append({
+                'id': team.id,
+                'abbreviation': team.abbreviation,
+                'city': team.location,
+                'mascot': team.nick_name,
+                'fullname': team.full_name,
+                'subreddit': teaminfo['subreddit'].replace('/r/', '') if teaminfo else None,
+                'twitter': '',
+                })
+            self.processed()
+        # Teams missing from nflteams keep the subreddit they have
+        upsert(session, NFLTeam, rows, ['id'], coalesce=['subreddit'])
         session.commit()
 
     def get_teams(self):
@@ -292,6 +335,7 @@ class NFLLineUpdater(GameThreadThread):
 
     def lap(self):
         session = self.Session()
+        rows = []
         for (home, away), lines in espn.get_lines().items():
             ht = aliased(NFLTeam)
             at = aliased(NFLTeam)
@@ -300,93 +344,116 @@ class NFLLineUpdater(GameThreadThread):
                 self.logger.warning("No game found for %s@%s", away, home)
                 continue
             for book, (spread, total) in lines.items():
-                line, created = get_or_create(session, NFLLine, game=nflgame.game, book=book)
-                line.spread = spread
-                line.total = total
+                rows.append({'game_id': nflgame.game_id, 'book': book, 'spread': spread, 'total': total})
+                self.processed()
+        upsert(session, NFLLine, rows, ['game_id', 'book'])
         session.commit()
 
 
 class NFLScheduleInfoUpdater(GameThreadThread):
     interval = timedelta(hours=1)
+    sharded = True
     setup = True
     nfl = NFL('gamethread/schedule')
 
     def lap(self):
         session = self.Session()
         
-        base_games = self.pending_games()
-        ids = [game.game_id for game in self.pending_games()]
-        
-        for sg in self.get_games(ids):
-            if not hasattr(sg, 'id'):
+        base_games = {game.game_id: game for game in self.pending_games()}
+        rows = []
+        for game in self.get_games(list(base_games)):
+            if not hasattr(game, 'id'):
                 continue
-            base_game = session.query(Game).filter(Game.game_id == sg.id).one()
-            nflgame, created = get_or_create(session, NFLGame, game=base_game, shieldid=sg.id)
-            
-            game = sg
-            
-            nflgame.home_id = game.home_team.id
-            nflgame.away_id = game.away_team.id
-            nflgame.season = game.season
-            nflgame.season_type = game.season_type
-            nflgame.week_type = game.week_type
-            nflgame.week = game.week
+            self.processed()
+            row = {
+                    'game_id': base_games[game.id].id,
+                    'shieldid': game.id,
+                    'home_id': game.home_team.id,
+                    'away_id': game.away_team.id,
+                    'season': game.season,
+                    'season_type': game.season_type,
+                    'week_type': game.week_type,
+                    'week': game.week,
+                    'game_detail_id': None,
+                    'site': game.venue.name,
+                    'kickoff_utc': None,
+                    }
             for ext in game.external_ids:
                 if ext.source == 'gamedetail':
-                    nflgame.game_detail_id = ext.id
+                    row['game_detail_id'] = ext.id
             channels = set()
             for channel in game.broadcast_info.away_network_channels + game.broadcast_info.home_network_channels:
                 channels.add(channel)
-            nflgame.tv = ", ".join(channels)
-            nflgame.site = game.venue.name
-            if nflgame.site in sites.sites:
-                nflgame.place = sites.sites[nflgame.site][1]
+            row['tv'] = ", ".join(channels)
+            if row['site'] in sites.sites:
+                row['place'] = sites.sites[row['site']][1]
             else:
-                raise Exception("Unknown site: %s" % nflgame.site)
+                raise Exception("Unknown site: %s" % row['site'])
             if game.time:
-                nflgame.kickoff_utc = pendulum.parse(game.time).astimezone(pendulum.UTC)
-
-            if created:
-                self.logger.info("Adding NFLGame for %r", game)
-                nflgame.home_score = 0
-                nflgame.away_score = 0
-                if nflgame.kickoff_utc > now():
-                    nflgame.state = GS_PENDING
-                else:
-                    nflgame.state = GS_UNKNOWN
-        
+                row['kickoff_utc'] = pendulum.parse(game.time).astimezone(pendulum.UTC)
+            rows.append(row)
+
+        # Score and state are only set for new games, the other updaters own them after that
+        update = [column for column in rows[0] if column != 'shieldid'] if rows else None
+        for row in rows:
+            row['home_score'] = 0
+            row['away_score'] = 0
+            row['state'] = GS_PENDING if row['kickoff_utc'] and row['kickoff_utc'] > now() else GS_UNKNOWN
+        # New games and moved kickoffs change when threads are due
+        kickoffs = {game.id: game.nfl_game.kickoff_utc if game.nfl_game else () for game in base_games.values()}
+        # Shield leaves these out at times, e.g. for flexed games. Keep what we know
+        nflgames = upsert(session, NFLGame, rows, ['shieldid'], update=update, coalesce=['game_detail_id', 'kickoff_utc'])
+        changed = [nflgame.game_id for nflgame in nflgames if kickoffs.get(nflgame.game_id) != nflgame.kickoff_utc]
         session.commit()
+        for game_id in changed:
+            self.publish(TOPIC_GAME, game_id)
 
     def get_games(self, ids):
-        for game_id in ids:
-            yield self.nfl.game.by_id(game_id)
+        return fetch_all(self.nfl.game.by_id, ids)
 
 
 class NFLForecastUpdater(GameThreadThread):
     interval = timedelta(minutes=10)
+    sharded = True
     setup = True #False
 
     def lap(self):
         session = self.Session()
+        games = []
         for game in self.games().filter(Game.state == Game.PENDING):
             if not game.nfl_game or not game.nfl_game.site:
                 self.logger.warning("Game %s has no NFLGame or site. Not getting weather", game)
                 continue
+            games.append(game)
+        rows = []
+        for game, forecast in zip(games, fetch_all(self.get_game_forecast, games)):
             try:
-                tz = sites.sites[game.nfl_game.site][0]
-                forecast = self.get_forecast(game.nfl_game.place, game.nfl_game.kickoff_utc, tz)
+                if isinstance(forecast, Exception):
+                    raise forecast
                 if forecast:
-                    fm, created = get_or_create(session, NFLForecast, game=game)
-                    fm.symbol_name = forecast['symbol']['@name']
-                    fm.symbol_var = forecast['symbol']['@var']
-                    fm.temp_c = forecast['temperature']['@value']
-                    fm.pressure_hpa = forecast['pressure']['@value']
-                    fm.windspeed_mps = forecast['windSpeed']['@mps']
-                    fm.prec_mm = forecast['precipitation']['@value']
+                    rows.append({
+                        'game_id': game.id,
+                        'symbol_name': forecast['symbol']['@name'],
+                        'symbol_var': forecast['symbol']['@var'],
+                        'temp_c': forecast['temperature']['@value'],
+                        'pressure_hpa': forecast['pressure']['@value'],
+                        'windspeed_mps': forecast['windSpeed']['@mps'],
+                        'prec_mm': forecast['precipitation']['@value'],
+                        })
+                    self.processed()
             except Exception as e:
                 self.logger.exception("Error getting weather for %r", game.nfl_game)
+        upsert(session, NFLForecast, rows, ['game_id'])
         session.commit()
 
+    def get_game_forecast(self, game):
+        """Forecast for a game, or the exception raised while getting it"""
+        try:
+            tz = sites.sites[game.nfl_game.site][0]
+            return self.get_forecast(game.nfl_game.place, game.nfl_game.kickoff_utc, tz)
+        except Exception as e:
+            return e
+
     def get_forecast(self, place, kickoff, tz):
         for forecast in Yr(location_name=place).forecast():
             forecast = self.localize_times(forecast, tz)
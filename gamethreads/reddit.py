@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+
+from praw import Reddit
+from prawcore import Requestor
+
+
+class TokenBucket:
+    """Spread requests evenly over Reddit's rate limit window
+
+    Every response tells us how many requests are left (X-Ratelimit-Remaining)
+    and how many seconds until the window resets (X-Ratelimit-Reset). The
+    bucket refills at the rate that uses up exactly what's left by the reset."""
+
+    def __init__(self, capacity=10, rate=1.0):
+        self.lock = threading.Lock()
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.rate = rate
+        self.refilled = time.monotonic()
+
+    def _refill(self):
+        t = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (t - self.refilled) * self.rate)
+        self.refilled = t
+
+    def available(self):
+        """Number of requests that can be made right now without waiting"""
+        with self.lock:
+            self._refill()
+            return int(self.tokens)
+
+    def acquire(self):
+        """Wait until a request may be made"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def update(self, remaining, reset):
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, remaining)
+            # With nothing left, the first token arrives when the window resets
+            self.rate = max(remaining, 1) / max(reset, 1)
+
+
+BUCKET = TokenBucket()
+
+
+class RateLimitedRequestor(Requestor):
+    """prawcore Requestor that takes every request from BUCKET"""
+
+    def request(self, *args, **kwargs):
+        BUCKET.acquire()
+        response = super().request(*args, **kwargs)
+        headers = response.headers
+        if 'x-ratelimit-remaining' in headers and 'x-ratelimit-reset' in headers:
+            BUCKET.update(float(headers['x-ratelimit-remaining']), float(headers['x-ratelimit-reset']))
+        return response
+
+
+def serialize_refresh(authorizer):
+    """Let one thread at a time refresh a prawcore authorizer's access token
+
+    prawcore checks the token before every request and refreshes it once it
+    has expired, which isn't thread-safe. Threads that find it expired at the
+    same time would all request a new token. With this, the first one does
+    and the others use its token. Only the refresh is locked."""
+    refresh = authorizer.refresh
+    lock = threading.Lock()
+
+    def locked_refresh():
+        with lock:
+            if not authorizer.is_valid():
+                refresh()
+    authorizer.refresh = locked_refresh
+
+
+_reddit = None
+_reddit_lock = threading.Lock()
+
+def get_reddit():
+    """The process-wide Reddit instance
+
+    All threads share its HTTP session and rate limit, so together they can
+    use the full allowed request rate without getting 429s. Requests are
+    made concurrently, only token refreshes are serialized."""
+    global _reddit
+    with _reddit_lock:
+        if _reddit is None:
+            logging.getLogger(__name__).info("Creating shared Reddit instance")
+            _reddit = Reddit(requestor_class=RateLimitedRequestor)
+            for core in (getattr(_reddit, '_read_only_core', None), getattr(_reddit, '_authorized_core', None)):
+                if core is not None and hasattr(core._authorizer, 'refresh'):
+                    serialize_refresh(core._authorizer)
+        return _reddit
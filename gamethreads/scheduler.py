@@ -0,0 +1,119 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_lap(updater):
+    """Run a lap of updater on a worker, returning its interval override"""
+    try:
+        return updater.run_lap()
+    finally:
+        # Workers are shared between updaters, so don't let a session
+        # outlive the lap that created it
+        if updater.Session is not None:
+            updater.Session.remove()
+
+
+def next_due(updater, due, started, interval_override, woken, now):
+    """When the next lap of updater is due, after one that was due at due and started at started
+
+    All times are seconds on the same clock as now."""
+    if woken:
+        next_due = now
+    elif interval_override is not None:
+        next_due = started + interval_override.total_seconds()
+    else:
+        # Anchor on the due time so regular laps don't drift
+        next_due = due + updater.interval.total_seconds()
+    return max(next_due, now)
+
+
+class Scheduler(threading.Thread):
+    """Drive the laps of many GameThreadThreads from a single thread.
+
+    Keeps a heap of (due, updater) entries and hands due laps to a bounded
+    worker pool. An updater never has more than one lap running at a time,
+    and wake() moves its next lap forward to now."""
+    staying_alive = True
+
+    def __init__(self, workers=4, logger=None):
+        super().__init__(name=type(self).__name__)
+        self.logger = logger or logging.getLogger(type(self).__name__)
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='lap')
+        self.cond = threading.Condition()
+        self.heap = []
+        self.seq = itertools.count()
+        self.updaters = []
+        # Due time of the live heap entry for each idle updater. Heap entries
+        # that don't match are stale (superseded by wake()) and are skipped.
+        self.due = {}
+        self.running = set()
+        self.rerun = set()
+
+    def add(self, updater, delay=None):
+        """Start scheduling laps for updater, the first one after delay"""
+        updater.scheduler = self
+        first = time.monotonic() + (delay.total_seconds() if delay else 0)
+        with self.cond:
+            self.updaters.append(updater)
+            self._schedule(updater, first)
+
+    def wake(self, updater):
+        """Run a lap for updater as soon as a worker is free"""
+        with self.cond:
+            if updater in self.running:
+                # Run again as soon as the current lap is done
+                self.rerun.add(updater)
+            elif updater in self.due and self.due[updater] > time.monotonic():
+                self._schedule(updater, time.monotonic())
+
+    def _schedule(self, updater, due):
+        self.due[updater] = due
+        heapq.heappush(self.heap, (due, next(self.seq), updater))
+        self.cond.notify()
+
+    def run(self):
+        self.logger.info("%s starting with %d workers", self.name, self.workers)
+        with self.cond:
+            while self.staying_alive:
+                if not self.heap:
+                    self.cond.wait()
+                    continue
+                due, _, updater = self.heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)
+                    continue
+                heapq.heappop(self.heap)
+                if self.due.get(updater) != due:
+                    continue
+                del self.due[updater]
+                self.running.add(updater)
+                self.pool.submit(self._lap, updater, due)
+        self.pool.shutdown(wait=True)
+        self.logger.info("%s ending", self.name)
+
+    def _lap(self, updater, due):
+        started = time.monotonic()
+        interval_override = run_lap(updater)
+        with self.cond:
+            self.running.discard(updater)
+            if not (self.staying_alive and updater.staying_alive):
+                return
+            woken = updater in self.rerun
+            self.rerun.discard(updater)
+            due = next_due(updater, due, started, interval_override, woken, time.monotonic())
+            self.logger.debug("Next lap of %s in %.1fs", updater.name, due - time.monotonic())
+            self._schedule(updater, due)
+
+    def terminate(self):
+        self.logger.warning("%s shutting down", self.name)
+        with self.cond:
+            self.staying_alive = False
+            for updater in self.updaters:
+                updater.staying_alive = False
+            self.cond.notify()
@@ -0,0 +1,76 @@
+from datetime import timedelta
+import logging
+import math
+import os
+import socket
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import Game, Lease
+from .util import now
+
+LEADER = 'leader'
+WORKER_PREFIX = 'worker:'
+GAME_PREFIX = 'game:'
+
+
+def default_worker_name():
+    return "%s-%d" % (socket.gethostname(), os.getpid())
+
+
+class Shard:
+    """This worker's share of the games when several workers share one database
+
+    Workers claim games through rows in the lease table, which they renew on
+    every refresh(). Each worker holds at most its fair share of the
+    unarchived games. Leases of a dead worker expire after ttl and are then
+    claimed by the others. Exactly one live worker holds the leader lease
+    and runs the updaters that aren't split by game."""
+
+    def __init__(self, worker=None, ttl=timedelta(seconds=90), logger=None):
+        self.logger = logger or logging.getLogger(type(self).__name__)
+        self.worker = worker or default_worker_name()
+        self.ttl = ttl
+        self.games = frozenset()
+        self.leader = False
+
+    def claim(self, session, keys, now_):
+        """Take or renew the leases on keys that are free, expired or already ours. Returns the keys we got"""
+        if not keys:
+            return set()
+        expires = now_ + self.ttl
+        stmt = insert(Lease).values([{'key': key, 'worker': self.worker, 'expires_utc': expires} for key in keys])
+        stmt = stmt.on_conflict_do_update(
+                index_elements=[Lease.key],
+                set_={'worker': stmt.excluded.worker, 'expires_utc': stmt.excluded.expires_utc},
+                where=or_(Lease.worker == self.worker, Lease.expires_utc < now_),
+                ).returning(Lease.key)
+        return {row.key for row in session.execute(stmt)}
+
+    def refresh(self, session):
+        now_ = now()
+        self.claim(session, [WORKER_PREFIX + self.worker], now_)
+        live_workers = session.query(Lease).filter(Lease.key.startswith(WORKER_PREFIX), Lease.expires_utc >= now_).count()
+        leader = LEADER in self.claim(session, [LEADER], now_)
+        if leader != self.leader:
+            self.logger.info("%s %s the leader", self.worker, "is now" if leader else "is no longer")
+        self.leader = leader
+
+        game_keys = {GAME_PREFIX + str(game_id) for game_id, in session.query(Game.id).filter(Game.state != Game.ARCHIVED)}
+        # Forget leases on archived games
+        session.query(Lease).filter(Lease.key.startswith(GAME_PREFIX), Lease.key.notin_(game_keys)).delete(synchronize_session=False)
+        leases = session.query(Lease).filter(Lease.key.in_(game_keys), Lease.expires_utc >= now_).all()
+        mine = sorted(lease.key for lease in leases if lease.worker == self.worker)
+        taken = {lease.key for lease in leases}
+        fair_share = math.ceil(len(game_keys) / max(live_workers, 1))
+        if len(mine) > fair_share:
+            # Another worker joined, let it have some games
+            release = mine[fair_share:]
+            self.logger.info("Releasing %d games to other workers", len(release))
+            session.query(Lease).filter(Lease.key.in_(release), Lease.worker == self.worker).delete(synchronize_session=False)
+            mine = mine[:fair_share]
+        free = sorted(game_keys - taken)[:fair_share - len(mine)]
+        owned = self.claim(session, mine + free, now_)
+        self.games = frozenset(int(key[len(GAME_PREFIX):]) for key in owned)
+        self.logger.debug("%s owns %d of %d games (%d live workers)", self.worker, len(self.games), len(game_keys), live_workers)
@@ -1,22 +1,26 @@
 #!/usr/bin/env python 
 from pprint import pprint
 from datetime import timedelta, datetime
+import hashlib
 import logging
 import threading
-import time
 
 import sqlalchemy
 from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert
 from requests.exceptions import HTTPError
+from jinja2 import meta, nodes
 from jinja2.sandbox import SandboxedEnvironment
-from praw import Reddit
 import pytz
 import roman
 
 from .SubredditCustomConfig import SubredditCustomConfig
 from .models import *
-from .util import get_or_create, now, make_safe, RedditWikiLoader, NotReadyException
+from .util import get_or_create, fetch_all, now, make_safe, normalize_body, RedditWikiLoader, NotReadyException
 from .basethread import GameThreadThread
+from .reddit import get_reddit, BUCKET
+from .outbox import queue_post, queue_edit, discard_edit, backoff, edit_spacing, thread_config
+from .events import TOPIC_GAME, TOPIC_CONFIG, TOPIC_OUTBOX
 from . import plugins
 
 UTC = pytz.utc
@@ -34,50 +38,129 @@ class GameUpdater(GameThreadThread):
         config = session.query(Config).all()[0].config
 
         # Archive games closed more than 4 days
-        for game in session.query(Game).filter(Game.state == Game.CLOSED, Game.state_changed_utc < now() - timedelta(days=4)):
-            self.logger.info("Archiving game %s", game)
-            game.state = Game.ARCHIVED
+        archived = session.query(Game).filter(Game.state == Game.CLOSED, Game.state_changed_utc < now() - timedelta(days=4)).update({Game.state: Game.ARCHIVED}, synchronize_session=False)
+        if archived:
+            self.logger.info("Archived %d games", archived)
 
+        changed = set()
         for game_type in config['types']:
             self.logger.debug("Finding new games for type %s", game_type)
             finder = getattr(plugins, game_type).gamefinder
             game_ids = finder.find_games()
-            for game_id in game_ids:
-                game, created = get_or_create(session, Game, game_type=game_type, game_id=game_id)
-                if created:
-                    self.logger.info("New game %r", game)
-                    session.add(game)
+            if game_ids:
+                stmt = insert(Game).values([{'game_type': game_type, 'game_id': str(game_id)} for game_id in game_ids])
+                for game in session.execute(stmt.on_conflict_do_nothing(index_elements=[Game.game_id]).returning(Game.id, Game.game_id)):
+                    self.logger.info("New game %s", game.game_id)
+                    self.processed()
+                    changed.add(game.id)
             # Update states of pending and active games
             self.logger.debug("Updating games for type %s", game_type)
-            for game in session.query(Game).filter(or_(Game.state.in_([Game.PENDING, Game.ACTIVE]), Game.state == None), Game.game_type == game_type):
-                self.logger.debug("Getting updated state for %r", game)
-                before = game.state
-                game = finder.update_state(game)
-                if before != game.state:
-                    self.logger.info("Updating state of %r to %s", game, game.state)
-                    game.state_changed_utc = now()
+            changed |= self.update_states(session, game_type, finder)
         session.commit()
-
-
-def make_context(game, config, thread = None):
-    MINUTE = timedelta(minutes=1)
-    HOUR = timedelta(hours=1)
-    DAY = timedelta(days=1)
+        for game_id in changed:
+            self.publish(TOPIC_GAME, game_id)
+
+    def update_states(self, session, game_type, finder):
+        """Move pending and active games to the state the plugin says they're in. Returns the ids of the games that changed
+
+        Plugins with a state_expression do it in a single UPDATE, the rest one game at a time with update_state."""
+        live = (or_(Game.state.in_([Game.PENDING, Game.ACTIVE]), Game.state == None), Game.game_type == game_type)
+        changed = set()
+        if hasattr(finder, 'state_expression'):
+            new_state = finder.state_expression()
+            stmt = sqlalchemy.update(Game).where(*live, Game.state.is_distinct_from(new_state)) \
+                    .values(state=new_state, state_changed_utc=now()) \
+                    .returning(Game.id, Game.game_id, Game.state)
+            for game in session.execute(stmt):
+                self.logger.info("Updating state of game %s to %s", game.game_id, game.state)
+                self.processed()
+                changed.add(game.id)
+            return changed
+        for game in session.query(Game).filter(*live):
+            self.logger.debug("Getting updated state for %r", game)
+            before = game.state
+            game = finder.update_state(game)
+            if before != game.state:
+                self.logger.info("Updating state of %r to %s", game, game.state)
+                game.state_changed_utc = now()
+                self.processed()
+                changed.add(game.id)
+        return changed
+
+MINUTE = timedelta(minutes=1)
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def base_context(game, config):
+    """The part of the context that doesn't depend on the thread or the time"""
     plugin = getattr(plugins, game.game_type)
     ctx = plugin.make_context(game, config)
     ctx['minutes'] = MINUTE
     ctx['hours'] = HOUR
     ctx['days'] = DAY
     ctx['base_game'] = game
-    ctx['thread'] = thread
-    ctx['now'] = now()
     return ctx
 
 
-class Renderer:
+def make_context(game, config, thread = None):
+    return dict(base_context(game, config), thread=thread, now=now())
+
+
+# Attributes computed from the current time (e.g. NFLGameData.age). A
+# template that reads any of them depends on now.
+VOLATILE_ATTRIBUTES = {'age'}
+
+def reads_volatile(ast):
+    """Whether a template reads one of VOLATILE_ATTRIBUTES, as foo.age or foo['age']"""
+    if any(node.attr in VOLATILE_ATTRIBUTES for node in ast.find_all(nodes.Getattr)):
+        return True
+    return any(isinstance(node.arg, nodes.Const) and node.arg.value in VOLATILE_ATTRIBUTES
+            for node in ast.find_all(nodes.Getitem))
+
+def input_versions(game, thread = None):
+    """Version of the data behind each context key. None marks keys that change all the time"""
+    plugin = getattr(plugins, game.game_type)
+    versions = plugin.input_versions(game)
+    versions.update({
+        'minutes': (),
+        'hours': (),
+        'days': (),
+        # Templates can link sibling threads through base_game.threads
+        'base_game': (game.state, tuple(sorted((t.sub_id, t.thread_type or '', t.thread_id or '', t.url or '') for t in game.threads))),
+        'thread': (thread.thread_id, thread.url) if thread else (),
+        'now': None,
+        })
+    return versions
+
+
+class ContextCache:
+    """Memoize template contexts, e.g. for the duration of a lap
+
+    The base context of a game is built once per timezone and version of
+    the game's data. Every caller gets a shallow copy with its own 'thread'
+    and 'now'."""
 
     def __init__(self):
+        self.contexts = {}
+
+    def get(self, game, config, thread = None):
+        plugin = getattr(plugins, game.game_type)
+        key = (game.id, config['timezone'], plugin.context_version(game))
+        if key not in self.contexts:
+            self.contexts[key] = base_context(game, config)
+        else:
+            # Game objects are shared between timezones
+            plugin.localize(game, config)
+        return dict(self.contexts[key], thread=thread, now=now())
+
+
+class Renderer:
+
+    def __init__(self, bytecode_cache = None):
         self.envs = {}
+        self.parsed = {}
+        self.bytecode_cache = bytecode_cache
         self.logger = logging.getLogger(type(self).__name__)
 
     def _get_env(self, sub):
@@ -85,91 +168,194 @@ class Renderer:
             self.envs = {}
         key = sub.display_name # Not sure using the sub itself would work
         if key not in self.envs:
-            self.envs[key] = SandboxedEnvironment(loader=RedditWikiLoader(sub, 'gamethreads/templates', timedelta(minutes=1)))
+            self.envs[key] = SandboxedEnvironment(loader=RedditWikiLoader(sub, 'gamethreads/templates'), bytecode_cache=self.bytecode_cache)
             self.envs[key].filters['to_roman'] = roman.toRoman
             self.envs[key].filters['from_roman'] = roman.fromRoman
         return self.envs[key]
 
-    def render_thread(self, reddit_sub, sub, thread_config, game, thread = None):
+    def prefetch(self, sub, names):
+        """Fetch the wiki pages of templates and their includes concurrently"""
+        env = self._get_env(sub)
+        env.loader.prefetch(env, names)
+
+    def dependencies(self, env, name, seen = None):
+        """Find the context keys used by a template and the templates it includes or imports
+
+        Returns (keys, sources), or None if the templates can't be determined statically"""
+        seen = set() if seen is None else seen
+        if name in seen:
+            return set(), []
+        seen.add(name)
+        env.get_template(name) # Makes sure the loader has the current source
+        source = env.loader.sources[name]
+        if (name, source) not in self.parsed:
+            ast = env.parse(source)
+            keys = meta.find_undeclared_variables(ast)
+            if reads_volatile(ast):
+                keys = keys | {'now'}
+            self.parsed[(name, source)] = (keys, list(meta.find_referenced_templates(ast)))
+        keys, refs = self.parsed[(name, source)]
+        keys, sources = set(keys), [source]
+        for ref in refs:
+            deps = self.dependencies(env, ref, seen) if ref is not None else None
+            if deps is None:
+                return None
+            keys |= deps[0]
+            sources += deps[1]
+        return keys, sources
+
+    def fingerprint(self, reddit_sub, sub, thread_config, game, thread = None):
+        """Hash of everything a render of the thread depends on
+
+        Returns None if the templates use something that changes all the time
+        (e.g. now), in which case the thread has to be rendered every time."""
+        env = self._get_env(reddit_sub)
+        env.loader.prefetch(env, [thread_config['template']])
+        deps = self.dependencies(env, thread_config['template'])
+        if deps is None:
+            return None
+        keys, sources = deps
+        versions = input_versions(game, thread)
+        used = sorted((key, versions[key]) for key in keys if key in versions)
+        if any(version is None for key, version in used):
+            return None
+        inputs = (thread_config['template'], sub.config['timezone'], sources, used)
+        return hashlib.sha1(repr(inputs).encode('utf-8')).hexdigest()
+
+    def render_thread(self, reddit_sub, sub, thread_config, game, thread = None, contexts = None):
         env = self._get_env(reddit_sub)
         template = env.get_template(thread_config['template'])
-        ctx = make_context(game, sub.config, thread)
+        if contexts is not None:
+            ctx = contexts.get(game, sub.config, thread)
+        else:
+            ctx = make_context(game, sub.config, thread)
         title, body = map(lambda s: s.strip(), template.render(ctx).split("\n", 1))
         return title, body
 
 
+# Shared by the poster and updater, so they use the same compiled templates
+RENDERER = Renderer()
+
+
 class ThreadPoster(GameThreadThread):
     interval = timedelta(seconds=15)
+    sharded = True
 
     def __init__(self, *args, **kwargs):
-        self.r = Reddit()
-        self.renderer = Renderer()
+        self.r = get_reddit()
+        self.renderer = RENDERER
+        self.condition_env = SandboxedEnvironment()
+        self.conditions = {}
+        # Times returned by datetime post conditions, by (sub_id, game_id, thread_type)
+        self.due = {}
         super().__init__(*args, **kwargs)
+        if self.bus is not None:
+            self.bus.subscribe(TOPIC_GAME, self.game_changed)
+            self.bus.subscribe(TOPIC_CONFIG, self.config_changed)
+
+    def config_changed(self, sub_name):
+        """Bus callback: drop compiled post conditions and due times that may be outdated"""
+        self.conditions = {}
+        self.due = {}
+
+    def take_changed_games(self):
+        """Games changed since the last lap, and games with a thread that has come due since"""
+        changed = super().take_changed_games()
+        now_ = now()
+        came_due = {key[1] for key, due in self.due.items() if due <= now_}
+        if changed or came_due:
+            # The data behind their post conditions changed, or they're evaluated again now
+            self.due = {key: due for key, due in self.due.items() if key[1] not in changed and due > now_}
+        return changed | came_due
+
+    def post_condition(self, expression):
+        """Compile a post_condition expression, or get it from the cache"""
+        conditions = self.conditions
+        if expression not in conditions:
+            conditions[expression] = self.condition_env.compile_expression(expression)
+        return conditions[expression]
 
     def lap(self):
         self.session = self.Session()
-        games = list(self.unarchived_games())
+        games = list(self.lap_games())
+        self.posted = self.posted_threads(games)
+        queued = 0
+        self.contexts = ContextCache()
         for sub in self.session.query(Subreddit).all():
             needs_posted = self.needs_posted(sub, games)
             reddit_sub = self.r.subreddit(sub.name)
+            if needs_posted:
+                self.renderer.prefetch(reddit_sub, {thread['template'] for thread, game in needs_posted})
             for thread, game in needs_posted:
-                submission = None
+                self.processed()
                 try:
-                    title, body = self.renderer.render_thread(reddit_sub, sub, thread, game)
+                    fingerprint = self.renderer.fingerprint(reddit_sub, sub, thread, game)
+                    title, body = self.renderer.render_thread(reddit_sub, sub, thread, game, contexts=self.contexts)
                 except Exception as e:
                     self.logger.exception("Could not render template %s with game %s", thread['template'], game)
+                    self.failed()
                     continue
-                self.logger.debug("Posting sub=<%s>, title=<%s>", sub, title)
-                try:
-                    submission = reddit_sub.submit(title, selftext=body, send_replies=False)
-                    self.logger.info("Posted %s to %s for game %s", thread['template'], sub, game)
-                    tm, _ = get_or_create(self.session, Thread, sub=sub, game=game, thread_type=thread['id'])
-                    tm.url = submission.permalink
-                    tm.posted_utc = now()
-                    tm.thread_id = submission.id
-                    tm.body = body
-                except Exception as e:
-                    self.logger.exception("Could not submit thread %s to %s", thread['template'], sub)
-                    if submission is not None:
-                        self.logger.warning("Submission could not be stored. Deleting to avoid orphaning")
-                        submission.delete()
+                self.logger.debug("Queueing post sub=<%s>, title=<%s>", sub, title)
+                queue_post(self.session, sub, game, thread, title, body, fingerprint)
+                self.posted.add((sub.id, game.id, thread['id']))
+                queued += 1
         self.session.commit()
+        if queued:
+            self.publish(TOPIC_OUTBOX, self.name)
+        if self.full_lap:
+            game_ids = {game.id for game in games}
+            self.due = {key: due for key, due in self.due.items() if key[1] in game_ids and key not in self.posted}
+        now_ = now()
+        upcoming = [due for due in self.due.values() if due > now_]
+        if upcoming:
+            # Wake up when the next thread is due, rather than on the next lap after it
+            return min(self.until_full_lap(), min(upcoming) - now_)
+        return self.until_full_lap()
+
+    def posted_threads(self, games):
+        """Fetch the keys (sub_id, game_id, thread_type) of all threads posted or queued for posting for games"""
+        if not games:
+            return set()
+        game_ids = [game.id for game in games]
+        posted = self.session.query(Thread.sub_id, Thread.game_id, Thread.thread_type).filter(Thread.game_id.in_(game_ids))
+        queued = self.session.query(Outbox.sub_id, Outbox.game_id, Outbox.thread_type).filter(Outbox.kind == Outbox.POST, Outbox.game_id.in_(game_ids))
+        return {tuple(row) for row in posted.union(queued)}
 
     def already_posted(self, sub, thread, game):
-        try:
-            self.session.query(Thread).filter_by(sub=sub, game=game, thread_type=thread['id']).one()
-            return True
-        except sqlalchemy.orm.exc.NoResultFound:
-            return False
+        return (sub.id, game.id, thread['id']) in self.posted
 
     def needs_posted(self, sub, games):
         """Taking a subreddit object and list of games, decide which threads need to be posted"""
-        env = SandboxedEnvironment()
         ret = []
         for thread in sub.config['threads']:
             self.logger.debug("Testing games against expression %s for sub %r", thread['post_condition'], sub)
-            post_cond_fun = env.compile_expression(thread['post_condition'])
+            post_cond_fun = self.post_condition(thread['post_condition'])
             for game in games:
                 self.logger.debug("Testing %s for thread %s for %r", game, thread['id'], sub)
                 if self.already_posted(sub, thread, game):
-                    # This could prove expensive, but it's easy for now.
-                    # Simple optimization: fetch all already_posted threads for non_archived games outside the loop
                     self.logger.debug("Game already posted, skipping")
                     continue
+                due_key = (sub.id, game.id, thread['id'])
+                if due_key in self.due and self.due[due_key] > now():
+                    self.logger.debug("Not due until %s, skipping", self.due[due_key])
+                    continue
 
                 try:
-                    ctx = make_context(game, sub.config)
+                    ctx = self.contexts.get(game, sub.config)
                 except NotReadyException as e:
                     self.logger.debug("Not ready to decide whether to post %s", game)
                     continue
                 except Exception as e:
                     self.logger.exception("Error generating context for game %s", game)
+                    self.failed()
                     continue
                 post_decision = post_cond_fun(ctx)
                 self.logger.debug("Decision for %r: %s", game, post_decision)
                 needs_posted = False
                 if isinstance(post_decision, datetime):
                     needs_posted = post_decision < now()
+                    if not needs_posted:
+                        self.due[due_key] = post_decision
                 elif isinstance(post_decision, bool):
                     needs_posted = post_decision
                 else:
@@ -182,40 +368,192 @@ class ThreadPoster(GameThreadThread):
 
 class ThreadUpdater(GameThreadThread):
     interval = timedelta(minutes=3)
+    sharded = True
 
     def __init__(self, *args, **kwargs):
-        self.r = Reddit()
-        self.renderer = Renderer()
-        self.envs = {}
+        self.r = get_reddit()
+        self.renderer = RENDERER
         super().__init__(*args, **kwargs)
+        if self.bus is not None:
+            self.bus.subscribe(TOPIC_GAME, self.game_changed)
 
     def lap(self):
         self.session = self.Session()
-        for game in self.unarchived_games():
+        contexts = ContextCache()
+        queued = 0
+        for game in self.lap_games():
             for thread in game.threads:
                 try:
                     self.logger.debug("Update %r", thread)
+                    self.processed()
                     sub = thread.sub
                     reddit_sub = self.r.subreddit(sub.name)
                     thread_config = list(filter(lambda x: x['id'] == thread.thread_type, sub.config['threads']))[0]
-                    title, body = self.renderer.render_thread(reddit_sub, sub, thread_config, game, thread)
-                    if body != thread.body:
-                        self.logger.debug("Updating thread %s", thread)
-                        submission = self.r.submission(id=thread.thread_id)
-                        submission.edit(body)
-                        thread.body = body
-                        time.sleep(3)
+                    fingerprint = self.renderer.fingerprint(reddit_sub, sub, thread_config, game, thread)
+                    if fingerprint is not None and fingerprint == thread.fingerprint:
+                        self.logger.debug("Inputs of %r unchanged, skipping", thread)
+                        continue
+                    title, body = self.renderer.render_thread(reddit_sub, sub, thread_config, game, thread, contexts)
+                    if normalize_body(body, thread_config) != normalize_body(thread.body, thread_config):
+                        self.logger.debug("Queueing edit of %s", thread)
+                        queue_edit(self.session, thread, thread_config, body)
+                        queued += 1
+                    else:
+                        # Back to what's already posted, give or take volatile text
+                        discard_edit(self.session, thread)
+                    thread.fingerprint = fingerprint
                 except Exception as e:
                     self.logger.exception("Updating submission %s failed", thread)
+                    self.failed()
         self.session.commit()
+        if queued:
+            self.publish(TOPIC_OUTBOX, self.name)
+        return self.until_full_lap()
+
+
+class OutboxWorker(GameThreadThread):
+    """Send the posts and edits in the outbox to reddit
+
+    Several workers (in this and other processes) can drain the outbox at
+    the same time. Each claims one row at a time with SKIP LOCKED, and
+    records the attempt before talking to reddit. If a post was submitted
+    but never recorded (e.g. a crash), the retry finds and adopts the
+    submission instead of posting it again."""
+    interval = timedelta(minutes=1)
+    # How soon to retry rows that were shed for lack of rate limit budget
+    retry_interval = timedelta(seconds=30)
+    max_attempts = 8
+    sharded = True
+
+    def __init__(self, *args, **kwargs):
+        self.r = get_reddit()
+        super().__init__(*args, **kwargs)
+        if self.bus is not None:
+            self.bus.subscribe(TOPIC_OUTBOX, lambda payload: self.wake())
+
+    def lap(self):
+        session = self.Session()
+        shed = 0
+        while self.staying_alive:
+            row = self.claim(session)
+            if row is None:
+                break
+            if not row.urgent and BUCKET.available() < 1:
+                # Out of the way until there may be budget again, so this doesn't spin
+                row.not_before_utc = now() + self.retry_interval
+                session.commit()
+                shed += 1
+                continue
+            row.attempts += 1
+            row.not_before_utc = now() + backoff(row.attempts)
+            session.commit()
+            self.processed()
+            try:
+                if row.kind == Outbox.POST:
+                    self.post(session, row)
+                else:
+                    self.edit(session, row)
+            except Exception as e:
+                self.logger.exception("Sending %r failed", row)
+                self.failed()
+                session.rollback()
+                row.last_error = repr(e)
+                if row.attempts >= self.max_attempts:
+                    self.give_up(session, row)
+            session.commit()
+
+        if shed:
+            self.logger.info("Delaying %d rows for lack of rate limit budget", shed)
+        rest = None
+        next_row = session.query(sqlalchemy.func.min(Outbox.not_before_utc)).filter(Outbox.failed == False).scalar()
+        if next_row is not None:
+            rest = next_row - now()
+        session.close()
+        return rest
+
+    def claim(self, session):
+        q = session.query(Outbox).filter(Outbox.failed == False, Outbox.not_before_utc <= now())
+        q = q.outerjoin(Outbox.thread).order_by(Outbox.priority,
+                sqlalchemy.func.coalesce(Thread.updated_utc, Thread.posted_utc).nullsfirst(), Outbox.created_utc)
+        return q.with_for_update(of=Outbox, skip_locked=True).first()
+
+    def post(self, session, row):
+        reddit_sub = self.r.subreddit(row.sub.name)
+        submission = None
+        if row.attempts > 1:
+            submission = self.find_submission(reddit_sub, row.title, row.created_utc)
+            if submission is not None:
+                self.logger.warning("Adopting earlier submission %s for %r", submission.id, row)
+        if submission is None:
+            submission = reddit_sub.submit(row.title, selftext=row.body, send_replies=False)
+            self.logger.info("Posted %s to %s for game %s", row.thread_type, row.sub, row.game)
+        tm, _ = get_or_create(session, Thread, sub=row.sub, game=row.game, thread_type=row.thread_type)
+        tm.url = submission.permalink
+        tm.posted_utc = now()
+        tm.thread_id = submission.id
+        tm.body = row.body
+        tm.fingerprint = row.fingerprint
+        session.delete(row)
+
+    def find_submission(self, reddit_sub, title, since):
+        """Find a submission of ours with the same title in the subreddit, posted after since
+
+        Goes through everything posted to the subreddit since then rather than
+        our own latest submissions, which are crowded out around kickoff."""
+        me = self.r.user.me().name.lower()
+        # Allow for our clock being ahead of reddit's
+        since = (since - timedelta(minutes=5)).timestamp()
+        for submission in reddit_sub.new(limit=None):
+            if submission.created_utc < since:
+                break
+            if submission.author is not None and submission.author.name.lower() == me and submission.title == title:
+                return submission
+
+    def edit(self, session, row):
+        thread = row.thread
+        body = row.body
+        self.logger.debug("Updating thread %s", thread)
+        self.r.submission(id=thread.thread_id).edit(body)
+        thread.body = body
+        thread.updated_utc = now()
+        # Unless a newer version was queued while we were sending this one
+        sent = session.query(Outbox).filter(Outbox.id == row.id, Outbox.body == body).delete(synchronize_session=False)
+        if not sent:
+            # It waits its turn like any other edit
+            not_before = thread.updated_utc + edit_spacing(thread_config(row.sub, row.thread_type))
+            session.query(Outbox).filter(Outbox.id == row.id).update({'attempts': 0, 'not_before_utc': not_before}, synchronize_session=False)
+
+    def give_up(self, session, row):
+        self.logger.error("Giving up on %r after %d attempts", row, row.attempts)
+        if row.kind == Outbox.EDIT:
+            # Render again next time rather than keeping a stale fingerprint
+            row.thread.fingerprint = None
+            session.delete(row)
+        else:
+            # Keep it, so the thread isn't queued again for another round of failures
+            row.failed = True
+
+
+class LeaseUpdater(GameThreadThread):
+    """Renew this worker's leases and rebalance games between workers"""
+    interval = timedelta(seconds=30)
+    sharded = True
+
+    def lap(self):
+        session = self.Session()
+        self.shard.refresh(session)
+        session.commit()
+        self.processed(len(self.shard.games))
 
 
 class ConfigUpdater(GameThreadThread):
     # TODO: Add validation with pykwalify
     interval = timedelta(minutes=15)
+    # Subreddit configs fetched at the same time
+    fetch_workers = 8
 
     def __init__(self, root_sub, *args, **kwargs):
-        self.r = Reddit()
+        self.r = get_reddit()
         self.root_sub = self.r.subreddit(root_sub)
         super().__init__(*args, **kwargs)
 
@@ -235,15 +573,34 @@ class ConfigUpdater(GameThreadThread):
             session.commit()
 
     def update_subreddits(self, sr_names):
-        for sr_name in sr_names:
-            self.logger.debug("Updating config for %s", sr_name)
-            session = self.Session()
-            obj, created = get_or_create(session, Subreddit, name=sr_name)
-            sr = self.r.subreddit(sr_name)
-            sr_config = SubredditCustomConfig(sr, 'gamethreads/config')
-            if obj.config != sr_config.config:
+        sr_names = sorted(sr_names)
+        configs = fetch_all(self.fetch_config, sr_names, workers=self.fetch_workers)
+        session = self.Session()
+        subs = {sub.name: sub for sub in session.query(Subreddit).filter(Subreddit.name.in_(sr_names))}
+        changed = []
+        for sr_name, config in zip(sr_names, configs):
+            self.processed()
+            if config is None:
+                self.failed()
+                continue
+            obj = subs.get(sr_name)
+            if obj is None:
+                obj = Subreddit(name=sr_name)
                 session.add(obj)
-                obj.config = sr_config.config
-                self.logger.info("Got updated config: %r", obj.config)
+            if obj.config != config:
+                obj.config = config
+                self.logger.info("Got updated config for %s: %r", sr_name, obj.config)
                 obj.config_updated_utc = now()
-            session.commit()
+                changed.append(sr_name)
+        session.commit()
+        for sr_name in changed:
+            self.publish(TOPIC_CONFIG, sr_name)
+
+    def fetch_config(self, sr_name):
+        """Get the config of a subreddit, or None if it can't be read"""
+        self.logger.debug("Updating config for %s", sr_name)
+        try:
+            return SubredditCustomConfig(self.r.subreddit(sr_name), 'gamethreads/config').config
+        except Exception:
+            self.logger.exception("Could not read config for %s, keeping the old one", sr_name)
+            return None
@@ -4,6 +4,19 @@ def now():
     return pytz.utc.localize(datetime.utcnow())
     
 
+from concurrent.futures import ThreadPoolExecutor
+def fetch_all(fetch, items, workers=8):
+    """Call fetch for every item concurrently and return the results in order
+
+    For network round-trips that would otherwise be made one after another
+    within a single lap."""
+    items = list(items)
+    if len(items) <= 1:
+        return [fetch(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(fetch, items))
+
+
 # http://stackoverflow.com/questions/2546207 
 import sqlalchemy
 def get_or_create(session,
@@ -24,6 +37,40 @@ def get_or_create(session,
             session.rollback()
             return session.query(model).filter_by(**kwargs).one(), False
 
+def upsert(session, model, rows, keys, update=None, coalesce=()):
+    """Insert rows of model, or update the rows already there
+
+    rows are dicts of column values, all with the same columns. keys are the
+    columns of a unique constraint to match existing rows on. update lists the
+    columns to overwrite in existing rows: by default every non-key column in
+    rows, () to leave existing rows alone. Columns in coalesce keep their
+    existing value where the row has None. Returns the resulting objects in
+    the order of rows."""
+    from sqlalchemy.dialects.postgresql import insert
+    # A statement can't touch the same row twice, so the last row for a key wins
+    unique = {tuple(row[key] for key in keys): row for row in rows}
+    if not unique:
+        return []
+    key_columns = [getattr(model, key) for key in keys]
+    stmt = insert(model).values(list(unique.values()))
+    if update is None:
+        update = [column for column in next(iter(unique.values())) if column not in keys]
+    if update:
+        set_ = {column: stmt.excluded[column] for column in update}
+        for column in coalesce:
+            if column in set_:
+                set_[column] = sqlalchemy.func.coalesce(stmt.excluded[column], getattr(model, column))
+        stmt = stmt.on_conflict_do_update(index_elements=key_columns, set_=set_)
+        stmt = stmt.returning(*model.__table__.columns)
+        query = sqlalchemy.select(model).from_statement(stmt).execution_options(populate_existing=True)
+        found = session.execute(query).scalars()
+    else:
+        # Don't write new versions of rows that stay as they are, read them back instead
+        session.execute(stmt.on_conflict_do_nothing(index_elements=key_columns))
+        found = session.query(model).filter(sqlalchemy.tuple_(*key_columns).in_(list(unique))).populate_existing()
+    objects = {tuple(getattr(obj, key) for key in keys): obj for obj in found}
+    return [objects[tuple(row[key] for key in keys)] for row in rows]
+
 # http://victorlin.me/posts/2012/08/26/good-logging-practice-in-python
 import logging.config
 import yaml
@@ -52,33 +99,139 @@ def setup_logging(
 def make_safe(model):
     return model
 
-from jinja2 import BaseLoader, TemplateNotFound
+from jinja2 import BaseLoader, TemplateNotFound, meta
 import re
 import sys
-from datetime import timedelta
+from .wiki import WIKI
 class RedditWikiLoader(BaseLoader):
-    def __init__(self, subreddit, root, ttl=timedelta(seconds=0)):
+    """Load templates from wiki pages below root, through the shared wiki cache
+
+    Templates compiled by an environment are kept until their page is revised."""
+    def __init__(self, subreddit, root):
         self.sub = subreddit
         self.root = re.sub('(^/*|/*$)', '', root) # Remove pre and postfix slashes
-        self.ttl = ttl
+        # Last source returned for each template
+        self.sources = {}
+        # (template, source) => names of the templates it references
+        self.refs = {}
 
     def get_source(self, environment, template):
         path = "%s/%s" % (self.root, template)
         try:
-            wp = self.sub.wiki[path]
+            revision, source = WIKI.get(self.sub, path)
         except Exception as e:
             raise TemplateNotFound(template)
-        evict = now() + self.ttl
-        return wp.content_md, None, lambda: evict > now()
+        self.sources[template] = source
+        # The filename is part of the bytecode cache key
+        filename = "%s/wiki/%s" % (self.sub.display_name.lower(), path)
+        return source, filename, lambda: WIKI.uptodate(self.sub, path, revision)
 
     def list_templates(self):
-        found = set()
-        for page in self.sub.wiki:
-            print(page)
-            print(repr(dir(page)))
-            if page.startswith(self.root):
-                found.add(page.replace(self.root, '', 1))
-        return found
+        prefix = self.root + '/'
+        return sorted(page.name[len(prefix):] for page in self.sub.wiki if page.name.startswith(prefix))
+
+    def prefetch(self, environment, templates):
+        """Fetch templates and everything they include or import ahead of rendering
+
+        The include/import graph is walked one level at a time, and the pages
+        of a level are fetched concurrently, unless they're all cached already.
+        Pages that are missing are left for get_source to report."""
+        seen = set()
+        level = set(templates)
+        while level:
+            seen |= level
+            names = sorted(level)
+            entries = [WIKI.cached(self.sub, "%s/%s" % (self.root, name)) for name in names]
+            if all(entry is not None for entry in entries):
+                pages = [(name, entry[1]) for name, entry in zip(names, entries)]
+            else:
+                pages = fetch_all(self._fetch, names)
+            level = set()
+            for page in pages:
+                if page is None:
+                    continue
+                level |= self.references(environment, *page)
+            level -= seen
+
+    def _fetch(self, template):
+        try:
+            return template, WIKI.get(self.sub, "%s/%s" % (self.root, template))[1]
+        except Exception:
+            return None
+
+    def references(self, environment, template, source):
+        """Names of the templates a template includes or imports, where they're constant"""
+        key = (template, source)
+        if key not in self.refs:
+            try:
+                ast = environment.parse(source)
+            except Exception:
+                # get_template will report it
+                refs = set()
+            else:
+                refs = {ref for ref in meta.find_referenced_templates(ast) if ref is not None}
+            self.refs[key] = refs
+        return self.refs[key]
+
+from jinja2 import BytecodeCache
+class DatabaseBytecodeCache(BytecodeCache):
+    """Keep compiled templates in the template_bytecode table
+
+    Entries are keyed by template name and filename (subreddit and wiki
+    path). Jinja checks the checksum of the source stored with the bytecode,
+    so a revised page is compiled again and its entry overwritten. Uses its
+    own connections, so it never commits the caller's session."""
+    def __init__(self, engine):
+        self.engine = engine
+        self.logger = logging.getLogger(type(self).__name__)
+
+    def load_bytecode(self, bucket):
+        from .models import TemplateBytecode
+        try:
+            with self.engine.connect() as conn:
+                row = conn.execute(sqlalchemy.select(TemplateBytecode.bytecode).where(TemplateBytecode.key == bucket.key)).first()
+        except Exception:
+            self.logger.warning("Could not load bytecode for %s", bucket.key, exc_info=True)
+            return
+        if row is not None:
+            bucket.bytecode_from_string(row.bytecode)
+
+    def dump_bytecode(self, bucket):
+        from .models import TemplateBytecode
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(TemplateBytecode).values(key=bucket.key, bytecode=bucket.bytecode_to_string(), updated_utc=now())
+        stmt = stmt.on_conflict_do_update(index_elements=[TemplateBytecode.key],
+                set_={'bytecode': stmt.excluded.bytecode, 'updated_utc': stmt.excluded.updated_utc})
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(stmt)
+        except Exception:
+            self.logger.warning("Could not store bytecode for %s", bucket.key, exc_info=True)
 
 class NotReadyException(Exception):
     pass
+
+# Templates wrap text that changes on every render (e.g. "updated 3 minutes
+# ago") in these markers. Changes between them alone aren't worth an edit
+VOLATILE_START = '[](#start-volatile)'
+VOLATILE_END = '[](#end-volatile)'
+VOLATILE_REGION = re.compile(re.escape(VOLATILE_START) + '.*?' + re.escape(VOLATILE_END), re.S)
+TIMESTAMP_PATTERNS = [
+        r'\d{4}-\d\d-\d\d[T ]\d\d:\d\d(:\d\d(\.\d+)?)?(Z|[+-]\d\d:?\d\d)?',
+        r'\b\d{1,2}:\d\d(:\d\d)?(\s*[AaPp]\.?[Mm]\.?)?(\s*[A-Z]{2,4}\b)?',
+        r'\b\d+\s+(second|minute|hour|day)s?\s+ago\b',
+        ]
+def normalize_body(body, thread_config):
+    """The part of a rendered body that's worth an edit when it changes
+
+    Drops volatile regions, matches of the thread's volatile_patterns and,
+    with ignore_timestamps, anything that looks like a time or date."""
+    if body is None:
+        return None
+    body = VOLATILE_REGION.sub('', body)
+    patterns = list(thread_config.get('volatile_patterns', []))
+    if thread_config.get('ignore_timestamps', False):
+        patterns += TIMESTAMP_PATTERNS
+    for pattern in patterns:
+        body = re.sub(pattern, '', body)
+    return body
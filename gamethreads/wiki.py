@@ -0,0 +1,106 @@
+import logging
+import threading
+import time
+
+
+class WikiCache:
+    """Process-wide cache of subreddit wiki pages
+
+    Pages are downloaded once and kept until a newer revision shows up. At
+    most once per ttl and subreddit, the subreddit's recent wiki revisions
+    are listed (a single request) to find the pages that changed since the
+    last check. Only those are downloaded again."""
+
+    def __init__(self, ttl=60, logger=None):
+        self.logger = logger or logging.getLogger(type(self).__name__)
+        self.lock = threading.RLock()
+        # Seconds between revision checks of a subreddit
+        self.ttl = ttl
+        # (sub, path) => (revision, content)
+        self.pages = {}
+        # sub => (time of the last check, newest revision id seen)
+        self.checked = {}
+        # (sub, path) => (revision, parsed content)
+        self.parsed = {}
+
+    @staticmethod
+    def key(subreddit, path):
+        return subreddit.display_name.lower(), path.lower()
+
+    def check(self, subreddit):
+        """Forget pages of subreddit that were revised since the last check, if it's due"""
+        sub = subreddit.display_name.lower()
+        with self.lock:
+            checked, newest = self.checked.get(sub, (None, None))
+            if checked is not None and time.monotonic() - checked < self.ttl:
+                return
+            self.checked[sub] = (time.monotonic(), newest)
+        changed = set()
+        latest = newest
+        try:
+            for i, revision in enumerate(subreddit.wiki.revisions(limit=100)):
+                if i == 0:
+                    latest = revision['id']
+                if revision['id'] == newest:
+                    break
+                changed.add(revision['page'].name.lower())
+            else:
+                if newest is not None:
+                    # Too many changes to tell which, start over
+                    changed = None
+        except Exception:
+            self.logger.warning("Could not list wiki revisions of %s, refetching all its pages", sub, exc_info=True)
+            changed = None
+        with self.lock:
+            self.checked[sub] = (time.monotonic(), latest)
+            for key in list(self.pages):
+                if key[0] == sub and (changed is None or key[1] in changed):
+                    self.logger.debug("Wiki page %s/%s changed", *key)
+                    del self.pages[key]
+
+    def cached(self, subreddit, path):
+        """Get (revision, content) of a wiki page if it's cached and no check is due, else None"""
+        sub, _ = key = self.key(subreddit, path)
+        with self.lock:
+            checked, newest = self.checked.get(sub, (None, None))
+            if checked is None or time.monotonic() - checked >= self.ttl:
+                return None
+            return self.pages.get(key)
+
+    def get(self, subreddit, path):
+        """Get (revision, content) of a wiki page"""
+        self.check(subreddit)
+        key = self.key(subreddit, path)
+        with self.lock:
+            if key in self.pages:
+                return self.pages[key]
+        self.logger.debug("Fetching wiki page %s/%s", *key)
+        page = subreddit.wiki[path]
+        content = page.content_md
+        entry = (getattr(page, 'revision_id', None) or object(), content)
+        with self.lock:
+            self.pages[key] = entry
+        return entry
+
+    def uptodate(self, subreddit, path, revision):
+        """Whether revision is still the current revision of a page"""
+        self.check(subreddit)
+        with self.lock:
+            entry = self.pages.get(self.key(subreddit, path))
+        return entry is not None and entry[0] == revision
+
+    def get_parsed(self, subreddit, path, parse):
+        """Get parse(content) of a wiki page, parsing again only when it's revised"""
+        revision, content = self.get(subreddit, path)
+        key = self.key(subreddit, path)
+        with self.lock:
+            cached = self.parsed.get(key)
+            if cached is not None and cached[0] == revision:
+                return cached[1]
+        parsed = parse(content)
+        with self.lock:
+            self.parsed[key] = (revision, parsed)
+        return parsed
+
+
+WIKI = WikiCache()
@@ -28,6 +28,7 @@ REQUIRED = [
     'python-yr>=1.4.5,<2',
     'PyYAML>=6.0,<7',
     'SQLAlchemy>=1.4.41,<1.5',
+    'alembic>=1.8,<2',
     'psycopg2>=2.7.3.1,<3',
     'roman>=3.3,<4',
     'nflapi @ git+https://git@github.com/rasher/nflapi@6846df73b0#egg=nflapi',
@@ -102,6 +103,7 @@ setup(
     entry_points={
         'console_scripts': [
             'gamethreads=gamethreads.gamethreader:main',
+            'gamethreads-async=gamethreads.gamethreader:main_async',
             'models=gamethreads.models:main',
             'redzone=gamethreads.plugins.nfl.redzone:main',
             'redditauth=gamethreads.auth:main',
@@ -0,0 +1,40 @@
+from gamethreads import delta
+
+
+VERSIONS = [
+        {'home': {'pts': 0, 'ot': None}, 'away': {'pts': 0, 'ot': None}, 'scrsummary': {}},
+        {'home': {'pts': 7, 'ot': None}, 'away': {'pts': 0, 'ot': None}, 'scrsummary': {'1': {'team': 'KC', 'type': 'TD'}}},
+        {'home': {'pts': 7, 'ot': None}, 'away': {'pts': 3, 'ot': None}, 'scrsummary': {'1': {'team': 'KC', 'type': 'TD'}, '2': {'team': 'BUF', 'type': 'FG'}}},
+        {'home': {'pts': 7, 'ot': 3}, 'away': {'pts': 3}, 'scrsummary': {'2': {'team': 'BUF', 'type': 'FG'}}, 'list': [1, None, 'a/b~c']},
+        {'home': None, 'away': {'pts': 3.0}, 'a/b': {'~': False}},
+        ]
+
+
+def test_replay_keeps_nulls():
+    before = {}
+    after = {'home': {'pts': 7, 'ot': None}}
+    assert delta.apply(before, delta.diff(before, after)) == after
+
+
+def test_replay_matches_content_hash():
+    content = {}
+    for version in VERSIONS:
+        ops = delta.diff(content, version)
+        content = delta.apply(content, ops)
+        assert content == version
+        assert delta.content_hash(content) == delta.content_hash(version)
+
+
+def test_no_change_no_ops():
+    for version in VERSIONS:
+        assert delta.diff(version, dict(version)) == []
+
+
+def test_apply_leaves_document_alone():
+    before = {'home': {'pts': 0}}
+    delta.apply(before, delta.diff(before, {'home': {'pts': 7}}))
+    assert before == {'home': {'pts': 0}}
+
+
+def test_hash_ignores_key_order():
+    assert delta.content_hash({'a': 1, 'b': None}) == delta.content_hash({'b': None, 'a': 1})
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip('gamethreads.util')
+from gamethreads.util import normalize_body, VOLATILE_START, VOLATILE_END
+
+
+def volatile(text):
+    return VOLATILE_START + text + VOLATILE_END
+
+
+def test_none():
+    assert normalize_body(None, {}) is None
+
+
+def test_plain_body_is_unchanged():
+    body = "Chiefs 7 - 3 Bills\n\nKickoff at 8:20 PM ET"
+    assert normalize_body(body, {}) == body
+
+
+def test_volatile_regions():
+    before = "Score 7-3 " + volatile("updated 1 minute ago") + " end"
+    after = "Score 7-3 " + volatile("updated\n2 minutes ago") + " end"
+    assert normalize_body(before, {}) == normalize_body(after, {}) == "Score 7-3  end"
+
+
+def test_volatile_regions_dont_hide_changes_outside_them():
+    before = "Score 7-3 " + volatile("a") + " end " + volatile("b")
+    after = "Score 7-10 " + volatile("a") + " end " + volatile("b")
+    assert normalize_body(before, {}) != normalize_body(after, {})
+
+
+def test_volatile_patterns():
+    config = {'volatile_patterns': [r'Viewers: \d+']}
+    assert normalize_body("Viewers: 10 | Q1", config) == normalize_body("Viewers: 12 | Q1", config)
+    assert normalize_body("Viewers: 10 | Q1", {}) != normalize_body("Viewers: 12 | Q1", {})
+
+
+@pytest.mark.parametrize('before, after', [
+    ("Updated 2026-09-13T17:00:00Z", "Updated 2026-09-13 17:05:12.5+00:00"),
+    ("Updated 5:00 PM EDT", "Updated 5:05 p.m. EDT"),
+    ("Updated 17:00:00", "Updated 17:05:59"),
+    ("Updated 1 minute ago", "Updated 12 minutes ago"),
+    ])
+def test_ignore_timestamps(before, after):
+    config = {'ignore_timestamps': True}
+    assert normalize_body(before, config) == normalize_body(after, config)
+    assert normalize_body(before, {}) != normalize_body(after, {})
+
+
+def test_ignore_timestamps_keeps_scores():
+    config = {'ignore_timestamps': True}
+    assert normalize_body("Chiefs 7 - 3 Bills", config) != normalize_body("Chiefs 14 - 3 Bills", config)
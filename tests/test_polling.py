@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+polling = pytest.importorskip('gamethreads.plugins.nfl.polling')
+from gamethreads.plugins.nfl.const import GS_UNKNOWN, GS_PENDING, GS_Q2, GS_HT, GS_F, EV_FINAL
+
+
+NOW = datetime(2026, 9, 13, 17, 0)
+CADENCE = {
+        polling.POLL_PENDING: timedelta(minutes=10),
+        polling.POLL_PENDING_NEAR: timedelta(minutes=1),
+        polling.POLL_PLAYING: timedelta(seconds=15),
+        polling.POLL_HALFTIME: timedelta(minutes=2),
+        polling.POLL_FINAL_GRACE: timedelta(minutes=1),
+        polling.POLL_DONE: None,
+        }
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=NOW)
+    monkeypatch.setattr(polling, 'now', lambda: clock.now)
+    return clock
+
+
+def game(id=1, state=GS_PENDING, kickoff=NOW + timedelta(hours=2), updated=None, events=()):
+    nfl_game = SimpleNamespace(state=state, kickoff_utc=kickoff, updated_utc=updated)
+    return SimpleNamespace(id=id, nfl_game=nfl_game, nfl_events=list(events))
+
+
+def phase(game):
+    return polling.poll_phase(game, timedelta(minutes=15), timedelta(minutes=30))
+
+
+def test_phase_pending():
+    assert phase(game()) == polling.POLL_PENDING
+    assert phase(game(kickoff=NOW + timedelta(minutes=5))) == polling.POLL_PENDING_NEAR
+    assert phase(game(state=GS_UNKNOWN, kickoff=None)) == polling.POLL_PENDING_NEAR
+    assert phase(SimpleNamespace(id=1, nfl_game=None, nfl_events=[])) == polling.POLL_PENDING_NEAR
+
+
+def test_phase_in_game():
+    assert phase(game(state=GS_Q2)) == polling.POLL_PLAYING
+    assert phase(game(state=GS_HT)) == polling.POLL_HALFTIME
+
+
+def test_phase_final_by_event():
+    final = SimpleNamespace(event=EV_FINAL, datetime_utc=NOW - timedelta(minutes=10))
+    assert phase(game(state=GS_F, events=[final])) == polling.POLL_FINAL_GRACE
+    final.datetime_utc = NOW - timedelta(hours=1)
+    assert phase(game(state=GS_F, events=[final])) == polling.POLL_DONE
+
+
+def test_phase_final_without_event():
+    assert phase(game(state=GS_F)) == polling.POLL_FINAL_GRACE
+    assert phase(game(state=GS_F, updated=NOW - timedelta(hours=1))) == polling.POLL_DONE
+
+
+def test_unpolled_games_are_due():
+    schedule = polling.PollSchedule(CADENCE)
+    games = [game(1), game(2)]
+    assert schedule.due(games) == games
+    assert schedule.next_interval() is None
+
+
+def test_polled_game_is_due_after_cadence(clock):
+    schedule = polling.PollSchedule(CADENCE)
+    g = game(state=GS_Q2)
+    schedule.polled(g)
+    assert schedule.due([g]) == []
+    assert schedule.next_interval() == timedelta(seconds=15)
+    clock.now += timedelta(seconds=15)
+    assert schedule.due([g]) == [g]
+
+
+def test_pending_game_wakes_up_before_kickoff(clock):
+    schedule = polling.PollSchedule(CADENCE)
+    g = game(kickoff=NOW + timedelta(minutes=20))
+    schedule.polled(g)
+    # Not after the 10 minute pending cadence, but when kickoff is near
+    assert schedule.next_interval() == timedelta(minutes=5)
+
+
+def test_unpolled_phase_is_polled_again_once_left():
+    schedule = polling.PollSchedule(dict(CADENCE, **{polling.POLL_PENDING: None}))
+    g = game()
+    schedule.polled(g)
+    assert schedule.due([g]) == []
+    assert schedule.next_interval() is None
+    g.nfl_game.state = GS_Q2
+    assert schedule.due([g]) == [g]
+
+
+def test_done_games_stay_done():
+    schedule = polling.PollSchedule(CADENCE)
+    g = game(state=GS_F, updated=NOW - timedelta(hours=1))
+    schedule.polled(g)
+    assert schedule.due([g]) == []
+
+
+def test_forgets_games_no_longer_passed_in():
+    schedule = polling.PollSchedule(CADENCE)
+    g1, g2 = game(1, state=GS_Q2), game(2, state=GS_Q2)
+    schedule.polled(g1)
+    schedule.polled(g2)
+    schedule.due([g2])
+    assert list(schedule.next_poll) == [2]
@@ -0,0 +1,154 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+from gamethreads.scheduler import Scheduler, run_lap, next_due
+
+HOUR = timedelta(hours=1)
+
+
+class Updater:
+    """Stands in for a GameThreadThread, recording its laps"""
+    Session = None
+    staying_alive = True
+    scheduler = None
+
+    def __init__(self, interval=HOUR, override=None, hold=None):
+        self.name = 'updater'
+        self.interval = interval
+        self.override = override
+        # Laps wait for this event, if set
+        self.hold = hold
+        self.laps = 0
+        self.running = 0
+        self.overlapped = False
+        self.lapped = threading.Event()
+
+    def run_lap(self):
+        self.running += 1
+        self.overlapped |= self.running > 1
+        self.laps += 1
+        self.lapped.set()
+        if self.hold is not None:
+            self.hold.wait(5)
+        self.running -= 1
+        return self.override
+
+
+class Session:
+    removed = 0
+
+    def remove(self):
+        self.removed += 1
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = Scheduler(workers=2)
+    scheduler.start()
+    yield scheduler
+    scheduler.terminate()
+    scheduler.join(5)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_next_due_anchors_on_due_time():
+    updater = Updater(interval=timedelta(seconds=60))
+    assert next_due(updater, 100, 103, None, False, 110) == 160
+
+
+def test_next_due_override_counts_from_start():
+    updater = Updater()
+    assert next_due(updater, 100, 103, timedelta(seconds=5), False, 104) == 108
+
+
+def test_next_due_woken_is_now():
+    updater = Updater()
+    assert next_due(updater, 100, 103, timedelta(seconds=5), True, 104) == 104
+
+
+def test_next_due_never_in_the_past():
+    updater = Updater(interval=timedelta(seconds=60))
+    assert next_due(updater, 100, 150, None, False, 200) == 200
+    assert next_due(updater, 100, 150, timedelta(0), False, 200) == 200
+
+
+def test_run_lap_removes_session():
+    updater = Updater(override=timedelta(seconds=1))
+    updater.Session = Session()
+    assert run_lap(updater) == timedelta(seconds=1)
+    assert updater.Session.removed == 1
+
+
+def test_run_lap_removes_session_when_lap_raises():
+    updater = Updater()
+    updater.Session = Session()
+    updater.run_lap = lambda: 1/0
+    with pytest.raises(ZeroDivisionError):
+        run_lap(updater)
+    assert updater.Session.removed == 1
+
+
+def test_first_lap_after_delay(scheduler):
+    updater = Updater()
+    scheduler.add(updater, delay=HOUR)
+    time.sleep(0.1)
+    assert updater.laps == 0
+
+
+def test_wake_runs_lap_now(scheduler):
+    updater = Updater()
+    scheduler.add(updater, delay=HOUR)
+    updater.scheduler.wake(updater)
+    wait_for(lambda: updater.laps == 1)
+
+
+def test_wake_during_lap_reruns_after_it(scheduler):
+    hold = threading.Event()
+    updater = Updater(hold=hold)
+    scheduler.add(updater)
+    assert updater.lapped.wait(5)
+    scheduler.wake(updater)
+    scheduler.wake(updater)
+    hold.set()
+    wait_for(lambda: updater.laps == 2)
+    time.sleep(0.1)
+    # Both wakes collapse into one rerun, and laps never overlap
+    assert updater.laps == 2
+    assert not updater.overlapped
+
+
+def test_interval_override(scheduler):
+    updater = Updater(override=timedelta(milliseconds=20))
+    scheduler.add(updater)
+    wait_for(lambda: updater.laps >= 3)
+
+
+def test_regular_interval(scheduler):
+    updater = Updater()
+    scheduler.add(updater)
+    wait_for(lambda: updater.laps == 1)
+    time.sleep(0.1)
+    assert updater.laps == 1
+
+
+def test_terminate_stops_laps():
+    scheduler = Scheduler(workers=1)
+    updater = Updater(override=timedelta(milliseconds=10))
+    scheduler.add(updater)
+    scheduler.start()
+    wait_for(lambda: updater.laps >= 1)
+    scheduler.terminate()
+    scheduler.join(5)
+    assert not scheduler.is_alive()
+    laps = updater.laps
+    time.sleep(0.1)
+    assert updater.laps == laps